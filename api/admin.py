@@ -13,7 +13,7 @@ class CollectionAdmin(admin.ModelAdmin):
     """ModelAdmin class for viewing Collection"""
     list_display = ['name']
     list_display_links = ['name']
-    search_fields = ['name', 'description']
+    search_fields = ['name', 'short_description', 'long_description']
     filter_horizontal = ['cards']
 
 
@@ -22,6 +22,8 @@ class ProfileAdmin(admin.ModelAdmin):
     list_display = ['get_username', 'get_email']
     search_fields = ['user__username', 'user__email']
     filter_horizontal = ['cards', 'collections']
+    # Dust is changed only with DustTransaction records
+    readonly_fields = ['dust']
 
     # Set ordering and description
     @admin.display(ordering='user__username', description='Username')
@@ -0,0 +1,20 @@
+from django.db.models import Aggregate, CharField
+
+
+class ConcatIds(Aggregate):
+    """Aggregates IDs into a comma separated string, order is not defined"""
+    function = 'GROUP_CONCAT'
+    template = '%(function)s(%(distinct)s%(expressions)s)'
+    output_field = CharField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, function='STRING_AGG',
+                              template="%(function)s(%(distinct)s%(expressions)s::text, ',')",
+                              **extra_context)
+
+
+def parse_ids(value):
+    """Returns sorted list of IDs from ConcatIds value"""
+    if not value:
+        return []
+    return sorted(int(id) for id in value.split(','))
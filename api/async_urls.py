@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# Hot read-only endpoints served by async views, other endpoints are the same as in api.urls
+urlpatterns = [
+    path('cards/', async_views.card_list_view),
+    path('cards/<str:id>/', async_views.card_detail_view),
+    path('collections/', async_views.collection_list_view),
+    path('collections/<str:id>/', async_views.collection_detail_view),
+    path('dashboard/', async_views.dashboard_view),
+    path('collection_progress/<int:collection_id>', async_views.collection_progress_view),
+    path('get_user_statistics/', async_views.user_statistics_view),
+    path('is_daily_card_available/', async_views.is_daily_card_available_view),
+] + sync_urlpatterns
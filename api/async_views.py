@@ -0,0 +1,155 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.utils import encoders
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .catalog_cache import get_catalog_cache_key, get_catalog_etag, get_catalog_request_digest, get_catalog_version
+from .views import (CardViewSet, CollectionViewSet, get_collection_progress, get_dashboard,
+                    get_user_statistics, is_daily_card_available)
+
+jwt_authentication = JWTAuthentication()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    """Returns JSON response encoded like DRF JSONRenderer"""
+    return JsonResponse(data, status=status_code, safe=False, encoder=encoders.JSONEncoder,
+                        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def get_jwt_token(request):
+    """Returns validated JWT of request, None without token. Does not use database."""
+    header = jwt_authentication.get_header(request)
+    if header is None:
+        return None
+    raw_token = jwt_authentication.get_raw_token(header)
+    if raw_token is None:
+        return None
+    return jwt_authentication.get_validated_token(raw_token)
+
+
+def get_jwt_user(request):
+    """Returns active User of JWT in request with Profile selected, None without token"""
+    token = get_jwt_token(request)
+    if token is None:
+        return None
+    try:
+        user_id = token[api_settings.USER_ID_CLAIM]
+        user = User.objects.select_related('profile').get(**{api_settings.USER_ID_FIELD: user_id})
+    except (KeyError, User.DoesNotExist):
+        raise exceptions.AuthenticationFailed()
+    if not user.is_active:
+        raise exceptions.AuthenticationFailed()
+    return user
+
+
+def async_api_view(handler):
+    """
+    Decorator making async read-only API view of sync handler(request, user, ...)
+    returning response data. Allows GET only, authenticates User by JWT like
+    JWTAuthentication and IsAuthenticated of sync views. Authentication and
+    handler run in one sync_to_async call, so request leaves event loop once.
+    """
+    def authenticated_handler(request, *args, **kwargs):
+        user = get_jwt_user(request)
+        if user is None:
+            raise exceptions.NotAuthenticated()
+        return handler(request, user, *args, **kwargs)
+
+    @wraps(handler)
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            detail = exceptions.MethodNotAllowed(request.method).detail
+            return json_response({'detail': detail}, status_code=status.HTTP_405_METHOD_NOT_ALLOWED)
+        try:
+            data = await sync_to_async(authenticated_handler)(request, *args, **kwargs)
+        except exceptions.APIException as e:
+            return json_response({'detail': e.detail}, status_code=e.status_code)
+        return json_response(data)
+    return view
+
+
+@async_api_view
+def is_daily_card_available_view(request, user):
+    """Async version of IsDailyCardAvailableView"""
+    return {'result': is_daily_card_available(user)}
+
+
+@async_api_view
+def collection_progress_view(request, user, collection_id):
+    """Async version of CollectionProgressView"""
+    return get_collection_progress(user.profile, collection_id)
+
+
+@async_api_view
+def user_statistics_view(request, user):
+    """Async version of GetUserStatisticsView"""
+    return get_user_statistics(user.profile)
+
+
+@async_api_view
+def dashboard_view(request, user):
+    """Async version of DashboardView"""
+    return get_dashboard(user, {'request': Request(request)})
+
+
+def get_cached_catalog(request, basename, action):
+    """Returns (data, etag, modified) of catalog response cached by CatalogCacheMixin, None if not cached"""
+    version, modified = get_catalog_version()
+    digest = get_catalog_request_digest(basename, action, request.build_absolute_uri())
+    data = cache.get(get_catalog_cache_key(version, digest))
+    if data is None:
+        return None
+    return data, get_catalog_etag(version, digest), modified
+
+
+def async_catalog_view(viewset, basename, actions):
+    """
+    Returns async view answering GET from catalog cache of viewset (see
+    CatalogCacheMixin). Catalog is the same for all users, so only JWT is
+    validated, without database query. Cache backend is sync, so cache is
+    read in thread. Cache misses and other methods are handled by sync
+    viewset in thread.
+    """
+    sync_view = sync_to_async(viewset.as_view(actions, basename=basename))
+    get_cached = sync_to_async(get_cached_catalog)
+
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            try:
+                token = get_jwt_token(request)
+            except exceptions.APIException:
+                token = None
+            if token is not None:
+                cached = await get_cached(request, basename, actions['get'])
+                if cached is not None:
+                    data, etag, modified = cached
+                    response = get_conditional_response(request, etag=etag,
+                                                        last_modified=int(modified.timestamp()))
+                    if response is None:
+                        response = json_response(data)
+                    response['ETag'] = etag
+                    response['Last-Modified'] = http_date(modified.timestamp())
+                    return response
+        return await sync_view(request, *args, **kwargs)
+
+    # Like DRF views, authentication is done with JWT, not session
+    view.csrf_exempt = True
+    return view
+
+
+card_list_view = async_catalog_view(CardViewSet, 'cards', {'get': 'list', 'post': 'create'})
+card_detail_view = async_catalog_view(CardViewSet, 'cards', {'get': 'retrieve', 'put': 'update',
+                                                             'patch': 'partial_update', 'delete': 'destroy'})
+collection_list_view = async_catalog_view(CollectionViewSet, 'collections', {'get': 'list', 'post': 'create'})
+collection_detail_view = async_catalog_view(CollectionViewSet, 'collections', {'get': 'retrieve', 'put': 'update',
+                                                                               'patch': 'partial_update',
+                                                                               'delete': 'destroy'})
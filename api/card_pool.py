@@ -0,0 +1,106 @@
+import random
+import uuid
+from array import array
+from threading import Lock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Card
+
+# Cache key holding the current catalog version stamp
+CARD_POOL_VERSION_KEY = 'api:card_pool:version'
+
+# Rarity chances, cumulative percents for random.randint(1, 100)
+RARITY_CHANCES = [
+    (70, 'common'),
+    (90, 'rare'),
+    (100, 'epic'),
+]
+
+
+def roll_rarity():
+    """Returns random rarity according to RARITY_CHANCES"""
+    chance = random.randint(1, 100)
+    for threshold, rarity in RARITY_CHANCES:
+        if chance <= threshold:
+            return rarity
+
+
+def get_card_pool_version():
+    """Returns current catalog version stamp shared through the cache"""
+    return cache.get(CARD_POOL_VERSION_KEY)
+
+
+def bump_card_pool_version():
+    """Sets new catalog version stamp, so every process rebuilds its pool"""
+    cache.set(CARD_POOL_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+class CardPool:
+    """
+    Per-process pool of Card IDs bucketed by rarity.
+    Stores only IDs in compact arrays and is rebuilt lazily when the
+    catalog version stamp differs from the one pool was built for.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._buckets = None
+        self._version = None
+
+    def _rebuild(self, version):
+        buckets = {}
+        for card_id, rarity in Card.objects.values_list('id', 'rarity').order_by('id'):
+            buckets.setdefault(rarity, array('q')).append(card_id)
+        self._buckets = buckets
+        self._version = version
+        return buckets
+
+    def get_buckets(self):
+        """Returns dict {rarity: array of Card IDs}, rebuilding it if stale"""
+        version = get_card_pool_version()
+        # Read once, concurrent invalidate() may set the attribute to None
+        buckets = self._buckets
+        if buckets is None or self._version != version:
+            with self._lock:
+                buckets = self._buckets
+                if buckets is None or self._version != version:
+                    buckets = self._rebuild(version)
+        return buckets
+
+    def invalidate(self):
+        """Drops pool of this process"""
+        with self._lock:
+            self._buckets = None
+
+    def draw(self, rarity):
+        """Returns random Card ID of given rarity"""
+        return random.choice(self.get_buckets().get(rarity, array('q')))
+
+    def draw_random(self):
+        """Rolls rarity and returns random Card ID of it"""
+        return self.draw(roll_rarity())
+
+    def draw_many(self, count):
+        """Rolls count rarities in one batch and returns list of Card IDs"""
+        buckets = self.get_buckets()
+        empty = array('q')
+        return [random.choice(buckets.get(roll_rarity(), empty)) for _ in range(count)]
+
+
+card_pool = CardPool()
+
+
+def _invalidate_card_pool():
+    bump_card_pool_version()
+    card_pool.invalidate()
+
+
+# Invalidate card pool if Card saved or deleted. Version is bumped after
+# commit, so other processes do not rebuild pool from uncommitted data.
+@receiver(post_save, sender=Card)
+@receiver(post_delete, sender=Card)
+def invalidate_card_pool(sender, **kwargs):
+    transaction.on_commit(_invalidate_card_pool)
@@ -0,0 +1,135 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Card, Collection
+
+# Cache key holding current catalog version and its modification time
+CATALOG_VERSION_KEY = 'api:catalog:version'
+
+# Lifetime of cached catalog data, it is also invalidated by catalog version
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+
+def get_catalog_version():
+    """Returns (version, last modified datetime) of Card and Collection catalog"""
+    catalog = cache.get(CATALOG_VERSION_KEY)
+    if catalog is None:
+        catalog = {'version': uuid.uuid4().hex, 'modified': timezone.now().replace(microsecond=0)}
+        if not cache.add(CATALOG_VERSION_KEY, catalog, timeout=None):
+            catalog = cache.get(CATALOG_VERSION_KEY, catalog)
+    return catalog['version'], catalog['modified']
+
+
+def bump_catalog_version():
+    """Sets new catalog version, so responses cached before are not used"""
+    catalog = {'version': uuid.uuid4().hex, 'modified': timezone.now().replace(microsecond=0)}
+    cache.set(CATALOG_VERSION_KEY, catalog, timeout=None)
+
+
+def get_catalog_request_digest(basename, action, url):
+    """Returns digest of view basename, action and absolute URL of request"""
+    return hashlib.md5(f'{basename}:{action}:{url}'.encode()).hexdigest()
+
+
+def get_catalog_cache_key(version, digest):
+    return f'api:catalog:{version}:{digest}'
+
+
+def get_catalog_etag(version, digest):
+    return f'"{version[:16]}-{digest}"'
+
+
+def get_catalog_counts_key():
+    version, _ = get_catalog_version()
+    return f'api:catalog:{version}:counts'
+
+
+def get_catalog_counts():
+    """Returns numbers of Cards and Collections, cached by catalog version"""
+    key = get_catalog_counts_key()
+    counts = cache.get(key)
+    if counts is None:
+        counts = {'n_cards': Card.objects.count(), 'n_collections': Collection.objects.count()}
+        cache.set(key, counts, timeout=CATALOG_CACHE_TIMEOUT)
+    return counts
+
+
+def invalidate_catalog_counts():
+    """Removes cached numbers of Cards and Collections"""
+    cache.delete(get_catalog_counts_key())
+
+
+class CatalogCacheMixin:
+    """
+    ViewSet mixin caching list and retrieve responses by catalog version.
+    Responses have ETag and Last-Modified headers, conditional requests
+    with If-None-Match or If-Modified-Since are answered with 304.
+    """
+    catalog_cache_timeout = CATALOG_CACHE_TIMEOUT
+
+    def list(self, request, *args, **kwargs):
+        return self.get_catalog_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_catalog_response(request, super().retrieve, *args, **kwargs)
+
+    def is_catalog_cacheable(self, request):
+        """Checks if response is the same for all users, so it may be cached"""
+        return True
+
+    def get_request_digest(self, request):
+        """Returns digest of view action and absolute URL of request"""
+        return get_catalog_request_digest(self.basename, self.action, request.build_absolute_uri())
+
+    def get_catalog_response(self, request, handler, *args, **kwargs):
+        if not self.is_catalog_cacheable(request):
+            return handler(request, *args, **kwargs)
+
+        version, modified = get_catalog_version()
+        digest = self.get_request_digest(request)
+        key = get_catalog_cache_key(version, digest)
+        etag = get_catalog_etag(version, digest)
+
+        not_modified = get_conditional_response(request._request, etag=etag,
+                                                 last_modified=int(modified.timestamp()))
+        if not_modified is not None:
+            return not_modified
+
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, timeout=self.catalog_cache_timeout)
+
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modified.timestamp())
+        return response
+
+
+# Bump catalog version if Card or Collection changed. Version is bumped after
+# commit, so concurrent requests do not cache data before the commit under it.
+@receiver(post_save, sender=Card)
+@receiver(post_delete, sender=Card)
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_catalog_on_save(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(m2m_changed, sender=Collection.cards.through)
+def invalidate_catalog_on_collection_cards(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,76 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Card, Collection, Profile
+
+# Profile counter fields by Profile M2M relation
+COUNTER_FIELDS = {
+    Profile.cards.through: 'n_cards',
+    Profile.collections.through: 'n_collections',
+}
+
+
+def _count(through):
+    rows = (through.objects
+            .filter(profile_id=OuterRef('id'))
+            .order_by()
+            .values('profile_id')
+            .annotate(n=Count('id'))
+            .values('n'))
+    return Coalesce(Subquery(rows), Value(0))
+
+
+def rebuild_profile_counters(profile_ids=None):
+    """Recounts owned Cards and completed Collections of Profiles. None means all profiles."""
+    profiles = Profile.objects.all()
+    if profile_ids is not None:
+        profiles = profiles.filter(id__in=profile_ids)
+    profiles.update(**{field: _count(through) for through, field in COUNTER_FIELDS.items()})
+
+
+def recount_profiles(through, profile_ids):
+    """Recounts one counter of given Profiles"""
+    if profile_ids:
+        Profile.objects.filter(id__in=profile_ids).update(**{COUNTER_FIELDS[through]: _count(through)})
+
+
+# Update counter if Profile collections changed. Profile.n_cards is updated
+# with owned cards bitmap by ownership.update_owned_cards, in the same query.
+@receiver(m2m_changed, sender=Profile.collections.through)
+def update_counters_on_profile_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    field = COUNTER_FIELDS[sender]
+    if reverse:
+        # instance is Card or Collection, pk_set contains Profile IDs
+        if action == 'pre_clear':
+            instance._counter_profile_ids = list(instance.profile_set.values_list('id', flat=True))
+        elif action == 'post_clear':
+            recount_profiles(sender, getattr(instance, '_counter_profile_ids', []))
+        elif action == 'post_add' and pk_set:
+            # pk_set of post_add contains only newly added relations
+            Profile.objects.filter(id__in=pk_set).update(**{field: F(field) + 1})
+        elif action == 'post_remove' and pk_set:
+            recount_profiles(sender, pk_set)
+        return
+
+    if action == 'post_add' and pk_set:
+        Profile.objects.filter(id=instance.id).update(**{field: F(field) + len(pk_set)})
+        setattr(instance, field, getattr(instance, field) + len(pk_set))
+    elif action in ('post_remove', 'post_clear'):
+        recount_profiles(sender, [instance.id])
+        setattr(instance, field, Profile.objects.values_list(field, flat=True).get(id=instance.id))
+
+
+# Relations of deleted Card or Collection are removed without m2m_changed
+@receiver(pre_delete, sender=Card)
+@receiver(pre_delete, sender=Collection)
+def remember_counter_profiles(sender, instance, **kwargs):
+    instance._counter_profile_ids = list(instance.profile_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Card)
+@receiver(post_delete, sender=Collection)
+def update_counters_on_delete(sender, instance, **kwargs):
+    through = Profile.cards.through if sender is Card else Profile.collections.through
+    recount_profiles(through, getattr(instance, '_counter_profile_ids', []))
@@ -0,0 +1,223 @@
+import os
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from PIL import Image, ImageOps, features
+
+# Directory inside MEDIA_ROOT for derivative images
+DERIVATIVES_DIR = 'derivatives'
+
+# Widths of thumbnails, every width is rendered in THUMBNAIL_FORMATS
+THUMBNAIL_WIDTHS = (120, 240, 480)
+
+# WebP versions are rendered only if Pillow is built with WebP support
+WEBP_SUPPORTED = features.check('webp')
+
+# Formats of thumbnails as (extension, Pillow format)
+THUMBNAIL_FORMATS = (('jpg', 'JPEG'), ('webp', 'WEBP')) if WEBP_SUPPORTED else (('jpg', 'JPEG'),)
+
+# Image fields of models with derivatives
+DERIVATIVE_FIELDS = {
+    'api.Card': ['image'],
+    'api.Collection': ['image1', 'image2', 'image3'],
+}
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_thumbnail_name(name, width, extension):
+    """Returns media path of thumbnail of image"""
+    stem = posixpath.splitext(name)[0]
+    return posixpath.join(DERIVATIVES_DIR, f'{stem}_{width}.{extension}')
+
+
+def get_webp_name(name):
+    """Returns media path of full size WebP version of image"""
+    stem = posixpath.splitext(name)[0]
+    return posixpath.join(DERIVATIVES_DIR, f'{stem}.webp')
+
+
+def get_grayscaled_name(name):
+    """Returns media path of grayscaled version of image, next to the image"""
+    stem, extension = posixpath.splitext(name)
+    return f'{stem}_grayscaled{extension}'
+
+
+def _is_fresh(path, source_mtime):
+    return os.path.exists(path) and os.path.getmtime(path) >= source_mtime
+
+
+def _save(image, path, image_format):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image.save(path, image_format, quality=85)
+
+
+def render_derivatives(media_root, name, grayscale=False):
+    """
+    Renders thumbnails, WebP and optionally grayscaled version of image.
+    Runs in worker process, so it uses only file system and Pillow.
+    Up-to-date derivatives are skipped. Returns (True if derivatives are
+    rendered, grayscaled image name if it was rendered, else None).
+    """
+    source = os.path.join(media_root, name)
+    if not os.path.exists(source):
+        return False, None
+    source_mtime = os.path.getmtime(source)
+
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    path = os.path.join(media_root, get_webp_name(name))
+    if WEBP_SUPPORTED and not _is_fresh(path, source_mtime):
+        _save(image, path, 'WEBP')
+
+    for width in THUMBNAIL_WIDTHS:
+        thumbnail = None
+        for extension, image_format in THUMBNAIL_FORMATS:
+            path = os.path.join(media_root, get_thumbnail_name(name, width, extension))
+            if _is_fresh(path, source_mtime):
+                continue
+            if thumbnail is None:
+                thumbnail = image.copy()
+                thumbnail.thumbnail((width, image.height * width // image.width or 1), Image.LANCZOS)
+            _save(thumbnail, path, image_format)
+
+    if grayscale:
+        grayscaled_name = get_grayscaled_name(name)
+        path = os.path.join(media_root, grayscaled_name)
+        if not _is_fresh(path, source_mtime):
+            _save(ImageOps.grayscale(image), path, 'JPEG')
+        return True, grayscaled_name
+    return True, None
+
+
+def get_executor():
+    """Returns process pool rendering derivatives, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2)
+            _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def set_grayscaled(card_id, grayscaled_name):
+    """Sets image_grayscaled of Card if it was not set manually"""
+    from .models import Card
+
+    if grayscaled_name:
+        Card.objects.filter(id=card_id, image_grayscaled='').update(image_grayscaled=grayscaled_name)
+
+
+def set_rendered(model, instance_id, name):
+    """
+    Adds image name to rendered_images of Card or Collection, so its
+    derivative URLs are advertised. Names of replaced images are dropped.
+    """
+    fields = DERIVATIVE_FIELDS[model._meta.label]
+    with transaction.atomic():
+        instance = model.objects.select_for_update().only('rendered_images', *fields).filter(id=instance_id).first()
+        if instance is None:
+            return
+        names = {getattr(instance, field).name for field in fields}
+        if name not in names:
+            return
+        rendered = [rendered_name for rendered_name in instance.rendered_images
+                    if rendered_name in names and rendered_name != name]
+        model.objects.filter(id=instance_id).update(rendered_images=rendered + [name])
+
+
+def _on_rendered(model, instance_id, name, card_id, future):
+    # Runs in executor thread, so it uses and closes its own DB connection
+    from .catalog_cache import bump_catalog_version
+
+    if future.exception() is not None:
+        return
+    rendered, grayscaled_name = future.result()
+    close_old_connections()
+    try:
+        if card_id is not None:
+            set_grayscaled(card_id, grayscaled_name)
+        if rendered:
+            set_rendered(model, instance_id, name)
+        # Cached catalog responses have original image URLs instead of derivatives
+        bump_catalog_version()
+    finally:
+        close_old_connections()
+
+
+def get_derivative_jobs(instance):
+    """Returns list of (image name, Card ID to set grayscaled or None)"""
+    jobs = []
+    for field in DERIVATIVE_FIELDS[instance._meta.label]:
+        image = getattr(instance, field)
+        if not image:
+            continue
+        card_id = instance.id if field == 'image' and not instance.image_grayscaled else None
+        jobs.append((image.name, card_id))
+    return jobs
+
+
+def submit_derivatives(instance):
+    """Schedules rendering of instance image derivatives in process pool"""
+    executor = get_executor()
+    for name, card_id in get_derivative_jobs(instance):
+        future = executor.submit(render_derivatives, str(settings.MEDIA_ROOT), name, card_id is not None)
+        future.add_done_callback(partial(_on_rendered, type(instance), instance.id, name, card_id))
+
+
+def render_instance_derivatives(instance):
+    """Renders derivatives of instance images in current process"""
+    from .catalog_cache import bump_catalog_version
+
+    for name, card_id in get_derivative_jobs(instance):
+        rendered, grayscaled_name = render_derivatives(str(settings.MEDIA_ROOT), name, card_id is not None)
+        if card_id is not None:
+            set_grayscaled(card_id, grayscaled_name)
+        if rendered:
+            set_rendered(type(instance), instance.id, name)
+    bump_catalog_version()
+
+
+def get_derivative_urls(name, rendered_images, request=None):
+    """
+    Returns URLs of image derivatives, absolute if request is given.
+    Until image name is in rendered_images of its instance (see
+    set_rendered), derivatives are replaced with URL of the original image.
+    """
+    rendered = name in rendered_images
+
+    def url(path):
+        path = default_storage.url(path if rendered else name)
+        return request.build_absolute_uri(path) if request is not None else path
+
+    if not name:
+        return None
+    return {
+        'webp': url(get_webp_name(name)) if WEBP_SUPPORTED else None,
+        'thumbnails': {
+            str(width): {extension: url(get_thumbnail_name(name, width, extension))
+                         for extension, _ in THUMBNAIL_FORMATS}
+            for width in THUMBNAIL_WIDTHS
+        },
+    }
+
+
+# Render image derivatives after Card or Collection saved
+@receiver(post_save, sender='api.Card')
+@receiver(post_save, sender='api.Collection')
+def render_derivatives_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if getattr(settings, 'IMAGE_DERIVATIVES_ASYNC', True):
+        transaction.on_commit(partial(submit_derivatives, instance))
+    else:
+        render_instance_derivatives(instance)
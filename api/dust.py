@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import DustTransaction, Profile
+
+# Reasons of DustTransaction records
+DUST_REASON_CRAFT = 'craft'
+DUST_REASON_TURN_TO_DUST = 'turn_to_dust'
+DUST_REASON_TURN_TO_DUST_BULK = 'turn_to_dust_bulk'
+
+
+class NotEnoughDust(Exception):
+    """Raised if Profile does not have enough dust to spend"""
+
+
+class EntriesChanged(Exception):
+    """Raised if CardEntry objects were changed while turning them into dust"""
+
+
+def change_dust(profile_id, amount, reason, card_id=None):
+    """
+    Adds amount (negative to spend) to Profile dust and returns new balance.
+    Balance is changed by one conditional UPDATE, so concurrent changes are
+    not lost and no row is locked beforehand. Spending more dust than
+    Profile has raises NotEnoughDust. Change is recorded in DustTransaction
+    in the same transaction.
+    """
+    profiles = Profile.objects.filter(id=profile_id)
+    if amount < 0:
+        profiles = profiles.filter(dust__gte=-amount)
+    # Failed UPDATE changes nothing, so no savepoint is needed in outer transaction
+    with transaction.atomic(savepoint=False):
+        changed = profiles.update(dust=F('dust') + amount)
+        if changed:
+            DustTransaction.objects.create(profile_id=profile_id, amount=amount, reason=reason, card_id=card_id)
+            balance = Profile.objects.values_list('dust', flat=True).get(id=profile_id)
+    if not changed:
+        raise NotEnoughDust
+    return balance
+
+
+def turn_entries_into_dust(profile_id, entries):
+    """
+    Deletes CardEntry queryset and adds turn_to_dust_value of their cards
+    to Profile dust. Returns (number of entries, dust added, new balance).
+    Dust is summed by one aggregate query, entries are deleted by one
+    DELETE and dust is added by one UPDATE in a single transaction. If
+    entries were changed by concurrent request in between, EntriesChanged
+    is raised and nothing is changed.
+    """
+    with transaction.atomic():
+        totals = entries.order_by().aggregate(n_entries=Count('id'),
+                                              dust=Coalesce(Sum('card__turn_to_dust_value'), Value(0)))
+        if not totals['n_entries']:
+            return 0, 0, Profile.objects.values_list('dust', flat=True).get(id=profile_id)
+        deleted, _ = entries.delete()
+        if deleted != totals['n_entries']:
+            raise EntriesChanged
+        balance = change_dust(profile_id, totals['dust'], DUST_REASON_TURN_TO_DUST_BULK)
+    return totals['n_entries'], totals['dust'], balance
+
+
+def rebuild_dust(profile_ids=None):
+    """Recalculates Profile dust as sum of its DustTransaction records. None means all profiles."""
+    balance = (DustTransaction.objects
+               .filter(profile_id=OuterRef('id'))
+               .order_by()
+               .values('profile_id')
+               .annotate(balance=Sum('amount'))
+               .values('balance'))
+    profiles = Profile.objects.all()
+    if profile_ids is not None:
+        profiles = profiles.filter(id__in=profile_ids)
+    profiles.update(dust=Coalesce(Subquery(balance), Value(0)))
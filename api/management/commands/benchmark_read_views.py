@@ -0,0 +1,97 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Collection
+
+
+class Command(BaseCommand):
+    """Command for comparing throughput of sync (WSGI) and async (ASGI) read views"""
+    help = ('Sends concurrent requests to hot read endpoints through Django WSGI handler with api.urls '
+            'and through ASGI handler with api.async_urls, prints requests per second. '
+            'Uses database of settings, the given user must exist in it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', required=True, help='Username to authenticate requests with')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=20, help='Concurrent requests')
+        parser.add_argument('--output', help='File to write results as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["user"]} does not exist')
+        authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+        paths = self.get_paths()
+
+        results = {}
+        for path in paths:
+            with override_settings(ROOT_URLCONF='api.urls'):
+                sync_times, sync_elapsed = self.run_sync(path, authorization, options['requests'], options['concurrency'])
+            with override_settings(ROOT_URLCONF='api.async_urls'):
+                async_times, async_elapsed = asyncio.run(
+                    self.run_async(path, authorization, options['requests'], options['concurrency']))
+            results[path] = {
+                'wsgi': self.get_stats(sync_times, sync_elapsed),
+                'asgi': self.get_stats(async_times, async_elapsed),
+            }
+            self.stdout.write(f'{path:40} WSGI {results[path]["wsgi"]["rps"]:8.1f} req/s   '
+                              f'ASGI {results[path]["asgi"]["rps"]:8.1f} req/s')
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+        self.stdout.write(self.style.SUCCESS('Benchmark finished.'))
+
+    def get_paths(self):
+        paths = ['/is_daily_card_available/', '/get_user_statistics/', '/dashboard/', '/cards/', '/collections/']
+        collection_id = Collection.objects.values_list('id', flat=True).first()
+        if collection_id is not None:
+            paths.append(f'/collection_progress/{collection_id}')
+        return paths
+
+    @staticmethod
+    def get_stats(times, elapsed):
+        times = sorted(times)
+        return {'rps': len(times) / elapsed,
+                'p50_ms': statistics.median(times) * 1000,
+                'p95_ms': times[int(len(times) * 0.95) - 1] * 1000}
+
+    def run_sync(self, path, authorization, n_requests, concurrency):
+        def request(_):
+            start = time.perf_counter()
+            response = Client().get(path, HTTP_AUTHORIZATION=authorization)
+            assert response.status_code == 200, response.content
+            close_old_connections()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            times = list(executor.map(request, range(n_requests)))
+        return times, time.perf_counter() - start
+
+    async def run_async(self, path, authorization, n_requests, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def request():
+            async with semaphore:
+                start = time.perf_counter()
+                # AsyncClient takes headers by name, not as WSGI environ keys
+                response = await client.get(path, authorization=authorization)
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        times = await asyncio.gather(*(request() for _ in range(n_requests)))
+        return times, time.perf_counter() - start
@@ -0,0 +1,37 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.catalog_cache import bump_catalog_version
+from api.media import is_content_addressed
+from api.models import Card, Collection
+
+# Image fields renamed to content hash names
+IMAGE_FIELDS = {
+    Card: ['image', 'image_grayscaled'],
+    Collection: ['image1', 'image2', 'image3'],
+}
+
+
+class Command(BaseCommand):
+    """Command for moving existing Card and Collection images to content hash names"""
+    help = ('Copies card and collection images to content hash names and updates the models. '
+            'Old files are kept, run render_image_derivatives afterwards')
+
+    def handle(self, *args, **options):
+        n_renamed = 0
+        for model, fields in IMAGE_FIELDS.items():
+            for instance in model.objects.only('id', *fields):
+                changed = {}
+                for field in fields:
+                    name = getattr(instance, field).name
+                    if not name or is_content_addressed(name) or not default_storage.exists(name):
+                        continue
+                    with default_storage.open(name) as content:
+                        changed[field] = default_storage.save(name, content)
+                if changed:
+                    model.objects.filter(id=instance.id).update(**changed)
+                    n_renamed += len(changed)
+
+        if n_renamed:
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Media files moved to content hash names: {n_renamed}.'))
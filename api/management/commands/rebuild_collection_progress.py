@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.progress import rebuild_collection_progress, update_collection_card_counts
+
+
+class Command(BaseCommand):
+    """Command for backfilling CollectionProgress from existing Profile cards"""
+    help = 'Recounts cards of collections and recalculates collection progress of profiles from owned cards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', type=int, action='append', dest='profile_ids',
+                            help='Profile ID to rebuild, may be repeated. All profiles by default.')
+        parser.add_argument('--collection', type=int, action='append', dest='collection_ids',
+                            help='Collection ID to rebuild, may be repeated. All collections by default.')
+
+    def handle(self, *args, **options):
+        update_collection_card_counts(options['collection_ids'])
+        n_records = rebuild_collection_progress(profile_ids=options['profile_ids'],
+                                                collection_ids=options['collection_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Collection progress rebuilt: {n_records} records written.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.dust import rebuild_dust
+
+
+class Command(BaseCommand):
+    """Command for recalculating dust of Profiles from DustTransaction records"""
+    help = 'Recalculates dust of profiles as sum of their dust transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', type=int, action='append', dest='profile_ids',
+                            help='Profile ID to rebuild, may be repeated. All profiles by default.')
+
+    def handle(self, *args, **options):
+        rebuild_dust(profile_ids=options['profile_ids'])
+        self.stdout.write(self.style.SUCCESS('Dust balances rebuilt.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.ownership import rebuild_owned_cards
+
+
+class Command(BaseCommand):
+    """Command for recalculating owned cards bitmaps of Profiles"""
+    help = 'Recalculates owned cards bitmaps of profiles from Profile cards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', type=int, action='append', dest='profile_ids',
+                            help='Profile ID to rebuild, may be repeated. All profiles by default.')
+
+    def handle(self, *args, **options):
+        rebuild_owned_cards(profile_ids=options['profile_ids'])
+        self.stdout.write(self.style.SUCCESS('Owned cards bitmaps rebuilt.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.catalog_cache import invalidate_catalog_counts
+from api.counters import rebuild_profile_counters
+
+
+class Command(BaseCommand):
+    """Command for fixing drift of Profile counters and cached catalog counts"""
+    help = 'Recounts owned cards and completed collections of profiles and resets cached card and collection counts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', type=int, action='append', dest='profile_ids',
+                            help='Profile ID to recount, may be repeated. All profiles by default.')
+
+    def handle(self, *args, **options):
+        rebuild_profile_counters(profile_ids=options['profile_ids'])
+        invalidate_catalog_counts()
+        self.stdout.write(self.style.SUCCESS('Counters reconciled.'))
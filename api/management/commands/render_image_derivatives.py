@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.catalog_cache import bump_catalog_version
+from api.derivatives import get_derivative_jobs, get_executor, render_derivatives, set_grayscaled, set_rendered
+from api.models import Card, Collection
+
+
+class Command(BaseCommand):
+    """Command for rendering derivatives of existing Card and Collection images"""
+    help = 'Renders thumbnails, WebP and grayscaled versions of card and collection images'
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in (Card, Collection):
+            for instance in model.objects.all():
+                jobs.extend((model, instance.id, name, card_id) for name, card_id in get_derivative_jobs(instance))
+
+        executor = get_executor()
+        futures = [(model, instance_id, name, card_id,
+                    executor.submit(render_derivatives, str(settings.MEDIA_ROOT), name, card_id is not None))
+                   for model, instance_id, name, card_id in jobs]
+        n_failed = 0
+        for model, instance_id, name, card_id, future in futures:
+            try:
+                rendered, grayscaled_name = future.result()
+            except Exception as e:
+                n_failed += 1
+                self.stderr.write(f'Failed to render derivatives: {e}')
+                continue
+            if card_id is not None:
+                set_grayscaled(card_id, grayscaled_name)
+            if rendered:
+                set_rendered(model, instance_id, name)
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(f'Image derivatives rendered: {len(jobs) - n_failed} images, '
+                                             f'{n_failed} failed.'))
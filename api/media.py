@@ -0,0 +1,97 @@
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import Http404, HttpResponse
+from django.utils._os import safe_join
+from django.views import static
+
+# Length of content hash used as file name
+CONTENT_HASH_LENGTH = 32
+
+# File name is a content hash, optionally with suffix of derived file (e.g. _thumb)
+CONTENT_ADDRESSED_RE = re.compile(r'^[0-9a-f]{%d}(_[\w-]+)?\.\w+$' % CONTENT_HASH_LENGTH)
+
+# Cache-Control of content addressed and other media files
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def is_content_addressed(name):
+    """Checks if media file name is content hash (or derived from one)"""
+    return bool(CONTENT_ADDRESSED_RE.match(posixpath.basename(name)))
+
+
+class ContentHashStorage(FileSystemStorage):
+    """
+    File system storage saving files under content hash names.
+    Uploaded 'dir/name.jpg' is saved as 'dir/<sha256 prefix>.jpg', so its
+    URL changes with content and may be cached as immutable. Files with
+    equal content are stored once. Names derived from a content addressed
+    file, like ckeditor '<hash>_thumb.jpg', are saved as is.
+    """
+    def _save(self, name, content):
+        if is_content_addressed(name):
+            return super()._save(name, content)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+    def get_content_name(self, name, content):
+        """Returns content addressed name of file in the same directory"""
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        directory, filename = posixpath.split(name)
+        extension = posixpath.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest.hexdigest()[:CONTENT_HASH_LENGTH] + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Same content addressed name means same content, file is reused
+        if is_content_addressed(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+
+def serve_media(request, path):
+    """
+    View for media files by MEDIA_SERVE_MODE setting:
+    'django' serves file from Python (development fallback),
+    'x-accel' hands delivery to nginx with X-Accel-Redirect to
+    MEDIA_ACCEL_REDIRECT_PREFIX, 'x-sendfile' to Apache/lighttpd.
+    Content addressed files are sent with immutable Cache-Control.
+    """
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+    if mode == 'django':
+        response = static.serve(request, path, document_root=settings.MEDIA_ROOT)
+    else:
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(full_path):
+            raise Http404
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        response = HttpResponse(content_type=content_type)
+        if mode == 'x-accel':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+        elif mode == 'x-sendfile':
+            response['X-Sendfile'] = full_path
+        else:
+            raise ValueError(f'Unknown MEDIA_SERVE_MODE: {mode}')
+
+    if is_content_addressed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = f'public, max-age={getattr(settings, "MEDIA_MAX_AGE", 3600)}'
+    return response
@@ -0,0 +1,261 @@
+import asyncio
+import hmac
+import time
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.renderers import JSONRenderer
+
+# Histogram buckets of durations in seconds and of query counts
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# Histograms as (name, help, buckets, RequestMetrics attribute)
+HISTOGRAMS = (
+    ('api_request_duration_seconds', 'Total time of request handling', DURATION_BUCKETS, 'total'),
+    ('api_request_db_seconds', 'Time of SQL queries per request', DURATION_BUCKETS, 'db_time'),
+    ('api_request_queries', 'Number of SQL queries per request', QUERY_BUCKETS, 'n_queries'),
+    ('api_request_serialize_seconds', 'Time of serializers per request, without SQL queries', DURATION_BUCKETS,
+     'serialize_time'),
+    ('api_request_render_seconds', 'Time of JSON rendering per request', DURATION_BUCKETS, 'render_time'),
+)
+
+# Metrics of request being handled, seen by DB wrapper in any thread of the request
+_current_metrics = ContextVar('api_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Numbers collected for one request"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0.0
+        self.n_queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.serializing = False
+
+    def stop(self):
+        self.total = time.perf_counter() - self.start
+
+    def get_server_timing(self):
+        """Returns Server-Timing header value, durations in milliseconds"""
+        return (f'db;dur={self.db_time * 1000:.1f};desc="{self.n_queries} queries", '
+                f'serialize;dur={self.serialize_time * 1000:.1f}, '
+                f'render;dur={self.render_time * 1000:.1f}, '
+                f'total;dur={(time.perf_counter() - self.start) * 1000:.1f}')
+
+
+class Histogram:
+    """Prometheus histogram with cumulative buckets"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Histograms of request metrics by (route, method), kept in process memory.
+    Each worker process has its own registry, so with several workers
+    /metrics/ shows numbers of the worker answering it; scrape workers
+    separately or run one worker per metrics endpoint.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = {}
+
+    def observe(self, route, method, metrics):
+        with self.lock:
+            for name, _, buckets, attribute in HISTOGRAMS:
+                key = (name, route, method)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(buckets)
+                self.histograms[key].observe(getattr(metrics, attribute))
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+
+    def render(self):
+        """Returns metrics in Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, help_text, _, _ in HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, route, method), histogram in sorted(self.histograms.items()):
+                    if metric != name:
+                        continue
+                    labels = f'route="{escape_label(route)}",method="{method}"'
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting queries and their time for current request"""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.n_queries += 1
+
+
+# Install query wrapper on every database connection
+@receiver(connection_created)
+def install_query_wrapper(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class MetricsSerializerMixin:
+    """
+    Serializer mixin recording time of outermost to_representation() as
+    serialization time of request. Time of SQL queries run meanwhile (lazy
+    querysets of related objects) is counted as DB time only.
+    """
+    def to_representation(self, instance):
+        metrics = _current_metrics.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        start = time.perf_counter()
+        db_time = metrics.db_time
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializing = False
+            metrics.serialize_time += time.perf_counter() - start - (metrics.db_time - db_time)
+
+
+class MetricsJSONRenderer(JSONRenderer):
+    """JSONRenderer recording rendering time of request"""
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics = _current_metrics.get()
+            if metrics is not None:
+                metrics.render_time += time.perf_counter() - start
+
+
+def get_route(request):
+    """Returns URL pattern of resolved request, used as metrics label"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route or match.view_name or 'unknown'
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    """
+    Middleware measuring SQL queries, DB time, serialization, JSON rendering and total time
+    of request. Numbers are sent in Server-Timing header (if
+    REQUEST_METRICS_SERVER_TIMING) and added to per-route histograms served
+    by metrics_view. Queries of streaming responses are counted until the
+    stream ends.
+    """
+    def __call__(self, request):
+        # Exit out to async mode, if needed
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.process_metrics(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.process_metrics(request, response, metrics)
+
+    def process_metrics(self, request, response, metrics):
+        if getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True):
+            response['Server-Timing'] = metrics.get_server_timing()
+
+        route = get_route(request)
+        if route == METRICS_ROUTE:
+            return response
+        if response.streaming:
+            response.streaming_content = self.iter_streaming(response.streaming_content, route,
+                                                             request.method, metrics)
+        else:
+            metrics.stop()
+            registry.observe(route, request.method, metrics)
+        return response
+
+    def iter_streaming(self, content, route, method, metrics):
+        # Queries run while the stream is consumed belong to the request
+        iterator = iter(content)
+        while True:
+            token = _current_metrics.set(metrics)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                _current_metrics.reset(token)
+            yield chunk
+        metrics.stop()
+        registry.observe(route, method, metrics)
+
+
+# Route of metrics view, its requests are not measured
+METRICS_ROUTE = 'metrics/'
+
+
+def is_metrics_allowed(request):
+    """Checks 'Authorization: Bearer <METRICS_TOKEN>' header and METRICS_ALLOWED_IPS"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        return False
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed_ips is not None and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return False
+    return hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), f'Bearer {token}'.encode())
+
+
+def metrics_view(request):
+    """
+    View for request metrics in Prometheus text format. Behind a proxy
+    every client has the proxy address, so METRICS_TOKEN is required.
+    """
+    if not is_metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.3 on 2026-10-17 01:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_alter_card_craft_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owned_count', models.IntegerField(default=0)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.collection')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.profile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='collectionprogress',
+            constraint=models.UniqueConstraint(fields=('profile', 'collection'), name='unique_collection_progress'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.3 on 2026-10-17 01:46
+
+from django.db import migrations, models
+
+
+def fill_owned_cards(apps, schema_editor):
+    Profile = apps.get_model('api', 'Profile')
+    card_ids = {}
+    for profile_id, card_id in Profile.cards.through.objects.values_list('profile_id', 'card_id'):
+        card_ids.setdefault(profile_id, []).append(card_id)
+    for profile_id, ids in card_ids.items():
+        bitmap = bytearray(max(ids) // 8 + 1)
+        for card_id in ids:
+            bitmap[card_id >> 3] |= 1 << (card_id & 7)
+        Profile.objects.filter(id=profile_id).update(owned_cards=bytes(bitmap))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_collectionprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='owned_cards',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.RunPython(fill_owned_cards, migrations.RunPython.noop),
+    ]
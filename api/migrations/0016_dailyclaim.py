@@ -0,0 +1,41 @@
+# Generated by Django 4.0.3 on 2026-10-17 01:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import pytz
+
+
+def fill_daily_claims(apps, schema_editor):
+    CardEntry = apps.get_model('api', 'CardEntry')
+    DailyClaim = apps.get_model('api', 'DailyClaim')
+    claims = set()
+    for user_id, acquired in CardEntry.objects.filter(source='daily').values_list('user_id', 'acquired'):
+        claims.add((user_id, acquired.astimezone(pytz.utc).date()))
+    DailyClaim.objects.bulk_create([DailyClaim(user_id=user_id, day=day) for user_id, day in claims],
+                                   ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0015_profile_owned_cards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyClaim',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('claimed', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyclaim',
+            constraint=models.UniqueConstraint(fields=('user', 'day'), name='unique_daily_claim'),
+        ),
+        migrations.RunPython(fill_daily_claims, migrations.RunPython.noop),
+    ]
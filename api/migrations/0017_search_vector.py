@@ -0,0 +1,37 @@
+# Generated by Django 4.0.3 on 2026-10-17 01:49
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from api.search import install_search_index, uninstall_search_index
+
+
+def install(apps, schema_editor):
+    models = [apps.get_model('api', 'Card'), apps.get_model('api', 'Collection')]
+    install_search_index(schema_editor.connection, models)
+
+
+def uninstall(apps, schema_editor):
+    models = [apps.get_model('api', 'Card'), apps.get_model('api', 'Collection')]
+    uninstall_search_index(schema_editor.connection, models)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_dailyclaim'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(install, uninstall),
+    ]
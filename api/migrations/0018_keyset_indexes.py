@@ -0,0 +1,21 @@
+# Generated by Django 4.0.3 on 2026-10-17 01:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cardentry',
+            index=models.Index(fields=['user', 'card', 'id'], name='cardentry_user_card_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['created', 'id'], name='collection_created_id_idx'),
+        ),
+    ]
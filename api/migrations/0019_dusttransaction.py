@@ -0,0 +1,35 @@
+# Generated by Django 4.0.3 on 2026-10-17 01:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_opening_balances(apps, schema_editor):
+    Profile = apps.get_model('api', 'Profile')
+    DustTransaction = apps.get_model('api', 'DustTransaction')
+    DustTransaction.objects.bulk_create([
+        DustTransaction(profile_id=profile_id, amount=dust, reason='opening_balance')
+        for profile_id, dust in Profile.objects.exclude(dust=0).values_list('id', 'dust')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DustTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('reason', models.CharField(max_length=50)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('card', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.card')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.profile')),
+            ],
+        ),
+        migrations.RunPython(fill_opening_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.0.3 on 2026-10-17 02:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_profile_counters(apps, schema_editor):
+    Profile = apps.get_model('api', 'Profile')
+
+    def count(through):
+        rows = (through.objects
+                .filter(profile_id=OuterRef('id'))
+                .order_by()
+                .values('profile_id')
+                .annotate(n=Count('id'))
+                .values('n'))
+        return Coalesce(Subquery(rows), Value(0))
+
+    Profile.objects.update(n_cards=count(Profile.cards.through),
+                           n_collections=count(Profile.collections.through))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_dusttransaction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='n_cards',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='n_collections',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_profile_counters, migrations.RunPython.noop),
+    ]
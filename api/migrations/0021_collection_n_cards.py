@@ -0,0 +1,32 @@
+# Generated by Django 4.0.3 on 2026-10-17 02:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_collection_n_cards(apps, schema_editor):
+    Collection = apps.get_model('api', 'Collection')
+    card_count = (Collection.cards.through.objects
+                  .filter(collection_id=OuterRef('id'))
+                  .order_by()
+                  .values('collection_id')
+                  .annotate(n=Count('id'))
+                  .values('n'))
+    Collection.objects.update(n_cards=Coalesce(Subquery(card_count), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_profile_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='collection',
+            name='n_cards',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_collection_n_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.3 on 2026-10-17 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_collection_n_cards'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cardentry',
+            name='cardentry_user_card_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cardentry',
+            index=models.Index(fields=['card', 'user', 'id'], name='cardentry_card_user_id_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.0.3 on 2026-10-17 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_cardentry_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='card',
+            name='rendered_images',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='rendered_images',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from email.policy import default
 from unicodedata import name
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -15,12 +16,16 @@ class Card(models.Model):
     long_description = RichTextUploadingField()
     image = models.ImageField()
     image_grayscaled = models.ImageField(blank=True)
+    # Image names with rendered derivatives, set when rendering finishes
+    rendered_images = models.JSONField(default=list, blank=True, editable=False)
     related_collection = models.ForeignKey('Collection', blank=True, null=True, on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
 
     rarity = models.CharField(max_length=20, blank=True)
     turn_to_dust_value = models.IntegerField(default=10)
     craft_cost = models.IntegerField(default=20)
+    # Full-text index on PostgreSQL, maintained by database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -31,12 +36,22 @@ class Collection(models.Model):
     name = models.CharField(max_length=100, unique=True)
     short_description = models.CharField(max_length=500)
     long_description = RichTextUploadingField()
-    n_cards = models.IntegerField()
+    # Number of cards, maintained by Collection.cards signals
+    n_cards = models.IntegerField(default=0, editable=False)
     image1 = models.ImageField()
     image2 = models.ImageField(default=None, blank=True)
     image3 = models.ImageField(default=None, blank=True)
+    # Image names with rendered derivatives, set when rendering finishes
+    rendered_images = models.JSONField(default=list, blank=True, editable=False)
     cards = models.ManyToManyField('Card', blank=True)
     created = models.DateTimeField(auto_now_add=True)
+    # Full-text index on PostgreSQL, maintained by database trigger
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created', 'id'], name='collection_created_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -49,6 +64,25 @@ class CardEntry(models.Model):
     source = models.CharField(max_length=50)
     acquired = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # MyCards keyset (card__name, id): Cards are walked by unique name
+            # index and User's entries of each Card are read in id order
+            models.Index(fields=['card', 'user', 'id'], name='cardentry_card_user_id_idx'),
+        ]
+
+
+class DailyClaim(models.Model):
+    """Class describes daily Card claimed by User on a day (UTC)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    day = models.DateField()
+    claimed = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_daily_claim'),
+        ]
+
 
 class Profile(models.Model):
     """Class describes Profile entity"""
@@ -56,6 +90,44 @@ class Profile(models.Model):
     cards = models.ManyToManyField('Card', blank=True)
     collections = models.ManyToManyField('Collection', blank=True)
     dust = models.IntegerField(default=0)
+    # Bitmap of owned Card IDs, maintained by Profile.cards signals
+    owned_cards = models.BinaryField(default=b'', editable=False)
+    # Numbers of owned Cards and completed Collections, maintained by signals
+    n_cards = models.IntegerField(default=0, editable=False)
+    n_collections = models.IntegerField(default=0, editable=False)
+
+    # Fields that are never written by save() of an existing Profile,
+    # dust is changed only by api.dust with DustTransaction records
+    signal_maintained_fields = ('owned_cards', 'dust', 'n_cards', 'n_collections')
+
+    def save(self, *args, **kwargs):
+        # Do not overwrite signal maintained fields with stale values
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key
+                                       and field.name not in self.signal_maintained_fields]
+        super().save(*args, **kwargs)
+
+
+class DustTransaction(models.Model):
+    """Class describes change of Profile dust, records are never changed or deleted"""
+    profile = models.ForeignKey('Profile', on_delete=models.CASCADE)
+    amount = models.IntegerField()
+    reason = models.CharField(max_length=50)
+    card = models.ForeignKey('Card', on_delete=models.SET_NULL, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+
+class CollectionProgress(models.Model):
+    """Class describes number of Collection cards owned by Profile"""
+    profile = models.ForeignKey('Profile', on_delete=models.CASCADE)
+    collection = models.ForeignKey('Collection', on_delete=models.CASCADE)
+    owned_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'collection'], name='unique_collection_progress'),
+        ]
 
 
 # Create Profile within user creation
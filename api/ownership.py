@@ -0,0 +1,119 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import Profile
+
+
+def card_ids_to_bitmap(card_ids):
+    """Returns bitmap bytes where bit N is set if Card ID N is in card_ids"""
+    card_ids = list(card_ids)
+    if not card_ids:
+        return b''
+    bitmap = bytearray(max(card_ids) // 8 + 1)
+    for card_id in card_ids:
+        bitmap[card_id >> 3] |= 1 << (card_id & 7)
+    return bytes(bitmap)
+
+
+def bitmap_to_card_ids(bitmap):
+    """Returns sorted list of Card IDs set in bitmap"""
+    card_ids = []
+    for index, byte in enumerate(bytes(bitmap)):
+        if byte:
+            card_ids.extend(index * 8 + bit for bit in range(8) if byte & (1 << bit))
+    return card_ids
+
+
+def _set_bits(bitmap, card_ids, value):
+    bitmap = bytearray(bytes(bitmap))
+    for card_id in card_ids:
+        index = card_id >> 3
+        if index >= len(bitmap):
+            if not value:
+                continue
+            bitmap.extend(bytes(index - len(bitmap) + 1))
+        if value:
+            bitmap[index] |= 1 << (card_id & 7)
+        else:
+            bitmap[index] &= ~(1 << (card_id & 7)) & 0xFF
+    return bytes(bitmap.rstrip(b'\x00'))
+
+
+def count_cards(bitmap):
+    """Returns number of Card IDs set in bitmap"""
+    return bin(int.from_bytes(bytes(bitmap), 'little')).count('1')
+
+
+def owns_card(profile, card_id):
+    """Checks if Profile owns Card with given ID"""
+    bitmap = profile.owned_cards
+    index = card_id >> 3
+    return index < len(bitmap) and bool(bitmap[index] & (1 << (card_id & 7)))
+
+
+def owned_card_ids(profile):
+    """Returns set of Card IDs owned by Profile"""
+    return set(bitmap_to_card_ids(profile.owned_cards))
+
+
+def update_owned_cards(profile_ids, card_ids, value):
+    """
+    Sets (value=True) or clears (value=False) card bits in Profile bitmaps
+    and updates Profile.n_cards by number of changed bits in the same query.
+    Returns dict {profile_id: (new bitmap, new n_cards)}.
+    """
+    profiles = {}
+    # Rows are locked till the end of outer transaction, if any
+    with transaction.atomic(savepoint=False):
+        rows = (Profile.objects
+                .select_for_update()
+                .filter(id__in=profile_ids)
+                .values_list('id', 'owned_cards', 'n_cards'))
+        for profile_id, bitmap, n_cards in rows:
+            new_bitmap = _set_bits(bitmap, card_ids, value)
+            n_cards += count_cards(new_bitmap) - count_cards(bitmap)
+            Profile.objects.filter(id=profile_id).update(owned_cards=new_bitmap, n_cards=n_cards)
+            profiles[profile_id] = (new_bitmap, n_cards)
+    return profiles
+
+
+def rebuild_owned_cards(profile_ids=None):
+    """Recalculates bitmaps from Profile.cards. None means all profiles."""
+    owned = Profile.cards.through.objects.order_by('profile_id')
+    profiles = Profile.objects.all()
+    if profile_ids is not None:
+        owned = owned.filter(profile_id__in=profile_ids)
+        profiles = profiles.filter(id__in=profile_ids)
+
+    card_ids = {}
+    for profile_id, card_id in owned.values_list('profile_id', 'card_id'):
+        card_ids.setdefault(profile_id, []).append(card_id)
+
+    with transaction.atomic():
+        for profile_id in profiles.values_list('id', flat=True):
+            bitmap = card_ids_to_bitmap(card_ids.get(profile_id, []))
+            Profile.objects.filter(id=profile_id).update(owned_cards=bitmap)
+
+
+# Keep owned cards bitmap and number of owned cards in sync with Profile cards
+@receiver(m2m_changed, sender=Profile.cards.through)
+def update_owned_cards_on_profile_cards(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance is Card, pk_set contains Profile IDs
+        if action == 'pre_clear':
+            instance._cleared_profile_ids = list(instance.profile_set.values_list('id', flat=True))
+        elif action == 'post_clear':
+            update_owned_cards(getattr(instance, '_cleared_profile_ids', []), [instance.id], False)
+        elif action in ('post_add', 'post_remove') and pk_set:
+            update_owned_cards(pk_set, [instance.id], action == 'post_add')
+        return
+
+    if action == 'post_clear':
+        Profile.objects.filter(id=instance.id).update(owned_cards=b'', n_cards=0)
+        instance.owned_cards = b''
+        instance.n_cards = 0
+    elif action in ('post_add', 'post_remove') and pk_set:
+        profiles = update_owned_cards([instance.id], pk_set, action == 'post_add')
+        if instance.id in profiles:
+            instance.owned_cards, instance.n_cards = profiles[instance.id]
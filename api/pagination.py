@@ -0,0 +1,155 @@
+import base64
+import binascii
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(pagination.PageNumberPagination):
+    """
+    Page number pagination with opt-in keyset (cursor) mode.
+    Keyset mode is used if request has ?pagination=cursor or ?cursor=...,
+    it orders by keyset_ordering, filters by the last row seen instead of
+    OFFSET and does not run COUNT(*). keyset_ordering must be unique, so
+    it should end with 'id'. Fields of related models are allowed.
+    Search results are ordered by rank, so keyset mode refuses them.
+    """
+    keyset_ordering = ('id',)
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    invalid_cursor_message = 'Invalid cursor'
+    search_cursor_message = 'Cursor pagination is not available for search results'
+
+    keyset = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = (request.query_params.get(self.mode_query_param) == 'cursor'
+                       or self.cursor_query_param in request.query_params)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        if 'search_rank' in queryset.query.annotations:
+            raise ValidationError({self.mode_query_param: [self.search_cursor_message]})
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        values, reverse = self.decode_cursor(request)
+
+        related = {field.lstrip('-').rsplit('__', 1)[0] for field in self.keyset_ordering if '__' in field}
+        if related:
+            queryset = queryset.select_related(*related)
+        if values is not None:
+            queryset = queryset.filter(self.get_keyset_filter(values, reverse))
+        ordering = [self.get_field_ordering(field, reverse) for field in self.keyset_ordering]
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_values = None
+        self.previous_values = None
+        if rows:
+            if has_more or reverse:
+                self.next_values = self.get_row_values(rows[-1])
+            if values is not None and (has_more or not reverse):
+                self.previous_values = self.get_row_values(rows[0])
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        return self.get_cursor_link(self.next_values, False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        return self.get_cursor_link(self.previous_values, True)
+
+    def get_cursor_link(self, values, reverse):
+        if values is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values, reverse))
+
+    @staticmethod
+    def get_field_ordering(field, reverse):
+        """Returns order_by() expression of keyset field, flipped if reverse"""
+        descending = field.startswith('-')
+        if descending == reverse:
+            return field.lstrip('-')
+        return '-' + field.lstrip('-')
+
+    def get_keyset_filter(self, values, reverse):
+        """Returns Q selecting rows after (before if reverse) given keyset values"""
+        condition = Q()
+        for index, field in enumerate(self.keyset_ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') != reverse else 'gt'
+            equal = {self.keyset_ordering[i].lstrip('-'): values[i] for i in range(index)}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[index]})
+        return condition
+
+    def get_row_values(self, row):
+        """Returns keyset values of the row"""
+        values = []
+        for field in self.keyset_ordering:
+            value = row
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, attr)
+            values.append(value)
+        return values
+
+    @staticmethod
+    def encode_value(value):
+        # DjangoJSONEncoder cuts datetimes to milliseconds, keyset needs microseconds
+        if isinstance(value, datetime.datetime):
+            return {'datetime': value.isoformat()}
+        return value
+
+    @staticmethod
+    def decode_value(value):
+        if isinstance(value, dict):
+            value = parse_datetime(value['datetime'])
+            if value is None:
+                raise ValueError
+        return value
+
+    def encode_cursor(self, values, reverse):
+        data = json.dumps({'v': [self.encode_value(value) for value in values], 'r': int(reverse)},
+                          cls=DjangoJSONEncoder)
+        return base64.urlsafe_b64encode(data.encode()).decode()
+
+    def decode_cursor(self, request):
+        """Returns (keyset values, reverse) of cursor, (None, False) for the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = data['v'], bool(data['r'])
+            if not isinstance(values, list) or len(values) != len(self.keyset_ordering):
+                raise ValueError
+            values = [self.decode_value(value) for value in values]
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
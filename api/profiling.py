@@ -0,0 +1,144 @@
+import asyncio
+import cProfile
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.deprecation import MiddlewareMixin
+
+from .metrics import get_route
+
+# Request header asking to profile request, its value must be PROFILING_HEADER_TOKEN
+PROFILING_HEADER = 'HTTP_X_PROFILE'
+
+
+class StackSampler:
+    """
+    Statistical profiler sampling call stack of one thread from background
+    thread every interval seconds. Stacks are counted in collapsed format
+    used by flamegraph.pl and speedscope.
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f'{stack} {count}\n')
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """
+    Middleware profiling PROFILING_SAMPLE_RATE fraction of requests and
+    requests with X-Profile header equal to PROFILING_HEADER_TOKEN.
+    PROFILING_MODE 'cprofile' writes pstats .prof files, 'sampling' writes
+    collapsed stacks for flamegraphs. Files are named by route and kept in
+    PROFILING_DIR, only PROFILING_MAX_FILES newest files are kept. If both
+    settings are off, middleware is not used at all. Requests to async
+    views are not profiled.
+    """
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.header_token = getattr(settings, 'PROFILING_HEADER_TOKEN', None)
+        if not self.sample_rate and not self.header_token:
+            raise MiddlewareNotUsed
+        self.mode = getattr(settings, 'PROFILING_MODE', 'cprofile')
+        self.directory = str(settings.PROFILING_DIR)
+        self.max_files = getattr(settings, 'PROFILING_MAX_FILES', 200)
+        self.sample_interval = getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005)
+        self._rotate_lock = threading.Lock()
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        # Exit out to async mode, if needed
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        requested = self.is_profile_requested(request)
+        if not requested and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        if self.mode == 'sampling':
+            profiler = StackSampler(threading.get_ident(), self.sample_interval)
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+        else:
+            profiler = cProfile.Profile()
+            response = profiler.runcall(self.get_response, request)
+
+        name = self.save_profile(profiler, get_route(request))
+        if requested:
+            response['X-Profile'] = name
+        return response
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def is_profile_requested(self, request):
+        value = request.META.get(PROFILING_HEADER)
+        # compare_digest accepts only ASCII str, header may contain any characters
+        return bool(self.header_token and value
+                    and hmac.compare_digest(value.encode(), self.header_token.encode()))
+
+    def save_profile(self, profiler, route):
+        """Writes profile to PROFILING_DIR, removes oldest files, returns file name"""
+        os.makedirs(self.directory, exist_ok=True)
+        extension = 'collapsed' if self.mode == 'sampling' else 'prof'
+        route_name = re.sub(r'\W+', '_', route).strip('_') or 'root'
+        name = f'{route_name}.{time.strftime("%Y%m%dT%H%M%S")}.{uuid.uuid4().hex[:8]}.{extension}'
+        path = os.path.join(self.directory, name)
+        if self.mode == 'sampling':
+            profiler.dump(path)
+        else:
+            profiler.dump_stats(path)
+        self.rotate()
+        return name
+
+    def rotate(self):
+        with self._rotate_lock:
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+            if len(paths) <= self.max_files:
+                return
+            files = []
+            for path in paths:
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except FileNotFoundError:
+                    continue
+            for _, path in sorted(files)[:len(files) - self.max_files]:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,155 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Card, Collection, CollectionProgress, Profile
+
+
+def get_owned_count(profile, collection):
+    """Returns number of Collection cards owned by Profile"""
+    owned_count = (CollectionProgress.objects
+                   .filter(profile=profile, collection=collection)
+                   .values_list('owned_count', flat=True)
+                   .first())
+    return owned_count or 0
+
+
+def is_collection_completed(profile, collection):
+    """Checks if Profile owns every card of Collection, without counting cards"""
+    return get_owned_count(profile, collection) >= collection.n_cards
+
+
+def get_completed_collection_ids(profile, collection_ids):
+    """Returns IDs of given Collections completed by Profile, in one query"""
+    owned_count = (CollectionProgress.objects
+                   .filter(profile=profile, collection=OuterRef('id'))
+                   .values('owned_count'))
+    completed = (Collection.objects
+                 .filter(id__in=collection_ids)
+                 .annotate(owned_count=Subquery(owned_count))
+                 .filter(owned_count__gte=F('n_cards')))
+    return list(completed.values_list('id', flat=True))
+
+
+def update_collection_card_counts(collection_ids=None):
+    """Recounts Collection.n_cards. None means all collections."""
+    card_count = (Collection.cards.through.objects
+                  .filter(collection_id=OuterRef('id'))
+                  .order_by()
+                  .values('collection_id')
+                  .annotate(n=Count('id'))
+                  .values('n'))
+    collections = Collection.objects.all()
+    if collection_ids is not None:
+        collections = collections.filter(id__in=collection_ids)
+    collections.update(n_cards=Coalesce(Subquery(card_count), Value(0)))
+
+
+def apply_progress_delta(profile_id, card_ids, sign):
+    """Adds (sign=1) or subtracts (sign=-1) given cards from Profile progress"""
+    deltas = dict(Collection.cards.through.objects
+                  .filter(card_id__in=card_ids)
+                  .order_by()
+                  .values('collection_id')
+                  .annotate(n=Count('card_id'))
+                  .values_list('collection_id', 'n'))
+    if not deltas:
+        return
+    # Existing records are updated with one query, missing ones are created
+    progress = CollectionProgress.objects.filter(profile_id=profile_id, collection_id__in=deltas)
+    delta = Case(*[When(collection_id=collection_id, then=Value(sign * n)) for collection_id, n in deltas.items()])
+    updated = progress.update(owned_count=F('owned_count') + delta)
+    if updated == len(deltas):
+        return
+    existing = set(progress.values_list('collection_id', flat=True)) if updated else set()
+    for collection_id, n in deltas.items():
+        if collection_id in existing:
+            continue
+        try:
+            with transaction.atomic():
+                CollectionProgress.objects.create(profile_id=profile_id, collection_id=collection_id,
+                                                  owned_count=max(sign * n, 0))
+        except IntegrityError:
+            # Created by concurrent request after the update
+            (CollectionProgress.objects
+             .filter(profile_id=profile_id, collection_id=collection_id)
+             .update(owned_count=F('owned_count') + sign * n))
+
+
+def rebuild_collection_progress(profile_ids=None, collection_ids=None):
+    """
+    Recalculates progress from Profile.cards and Collection.cards.
+    Scope may be narrowed by profile and/or collection IDs, None means all.
+    Returns number of progress records written.
+    """
+    owned_filter = {'card__collection__isnull': False}
+    progress = CollectionProgress.objects.all()
+    if profile_ids is not None:
+        owned_filter['profile_id__in'] = profile_ids
+        progress = progress.filter(profile_id__in=profile_ids)
+    if collection_ids is not None:
+        owned_filter['card__collection__in'] = collection_ids
+        progress = progress.filter(collection_id__in=collection_ids)
+
+    rows = (Profile.cards.through.objects
+            .filter(**owned_filter)
+            .values('profile_id', 'card__collection')
+            .annotate(n=Count('card_id')))
+
+    with transaction.atomic():
+        progress.delete()
+        records = CollectionProgress.objects.bulk_create(
+            CollectionProgress(profile_id=row['profile_id'], collection_id=row['card__collection'],
+                               owned_count=row['n'])
+            for row in rows
+        )
+    return len(records)
+
+
+# Update progress if Profile cards changed
+@receiver(m2m_changed, sender=Profile.cards.through)
+def update_progress_on_profile_cards(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance is Card, pk_set contains Profile IDs
+        rebuild_collection_progress(profile_ids=pk_set,
+                                    collection_ids=list(instance.collection_set.values_list('id', flat=True)))
+    elif action == 'post_clear':
+        CollectionProgress.objects.filter(profile=instance).delete()
+    elif pk_set:
+        apply_progress_delta(instance.id, pk_set, 1 if action == 'post_add' else -1)
+
+
+# Update progress if Collection cards changed
+@receiver(m2m_changed, sender=Collection.cards.through)
+def update_progress_on_collection_cards(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance is Card, pk_set contains Collection IDs
+        if action == 'post_clear':
+            update_collection_card_counts()
+            rebuild_collection_progress()
+        else:
+            update_collection_card_counts(pk_set)
+            rebuild_collection_progress(collection_ids=pk_set)
+    else:
+        update_collection_card_counts([instance.id])
+        rebuild_collection_progress(collection_ids=[instance.id])
+
+
+# Collection cards of deleted Card are removed without m2m_changed
+@receiver(pre_delete, sender=Card)
+def remember_card_collections(sender, instance, **kwargs):
+    instance._progress_collection_ids = list(instance.collection_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Card)
+def update_progress_on_card_delete(sender, instance, **kwargs):
+    collection_ids = getattr(instance, '_progress_collection_ids', [])
+    if collection_ids:
+        update_collection_card_counts(collection_ids)
+        rebuild_collection_progress(collection_ids=collection_ids)
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import tempfile
+from threading import Lock
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+from .derivatives import WEBP_SUPPORTED
+
+# Formats of resized images as {fmt query parameter: (Pillow format, content type)}
+RESIZE_FORMATS = {
+    'jpg': ('JPEG', 'image/jpeg'),
+    'png': ('PNG', 'image/png'),
+}
+if WEBP_SUPPORTED:
+    RESIZE_FORMATS['webp'] = ('WEBP', 'image/webp')
+
+
+class ResizeCache:
+    """
+    Disk cache of resized images bounded by total size.
+    Cached file mtime is bumped on every hit and the least recently used
+    files are evicted when size exceeds max_bytes. Concurrent requests
+    for the same variant in a process wait for a single render.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._size_lock = Lock()
+        # Render locks as {key: [lock, number of threads using it]}
+        self._locks = {}
+        self._locks_lock = Lock()
+
+    def get_key(self, name, source_mtime, width, fmt):
+        return hashlib.sha1(f'{name}:{source_mtime}:{width}:{fmt}'.encode()).hexdigest()
+
+    def get_path(self, key, fmt):
+        return os.path.join(self.directory, key[:2], f'{key}.{fmt}')
+
+    def open(self, source, name, width, fmt):
+        """
+        Returns (opened resized image file, cache key), renders it on miss.
+        File is opened before eviction, so it can be served even if evicted.
+        """
+        key = self.get_key(name, os.path.getmtime(source), width, fmt)
+        path = self.get_path(key, fmt)
+        if self._touch(path):
+            try:
+                return self._open(path), key
+            except FileNotFoundError:
+                pass
+
+        with self._locks_lock:
+            entry = self._locks.setdefault(key, [Lock(), 0])
+            entry[1] += 1
+        rendered = False
+        try:
+            with entry[0]:
+                if not self._touch(path):
+                    self._render(source, path, width, fmt)
+                    rendered = True
+                image_file = self._open(path)
+        finally:
+            # Lock is dropped by the last thread using it, waiters keep the same lock
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+        if rendered:
+            self._add_size(os.fstat(image_file.fileno()).st_size)
+        return image_file, key
+
+    def _open(self, path):
+        # Opened by descriptor, file object has no path that may be evicted
+        return os.fdopen(os.open(path, os.O_RDONLY), 'rb')
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _render(self, source, path, width, fmt):
+        image_format = RESIZE_FORMATS[fmt][0]
+        with Image.open(source) as original:
+            image = ImageOps.exif_transpose(original)
+            if image_format == 'JPEG':
+                image = image.convert('RGB')
+            if image.width > width:
+                height = max(image.height * width // image.width, 1)
+                image = image.resize((width, height), Image.LANCZOS)
+
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as tmp_file:
+                    image.save(tmp_file, image_format, quality=85)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _add_size(self, size):
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(file_size for _, file_size, _ in self._scan())
+            else:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Remove least recently used files until cache is 90% of max_bytes
+        files = sorted(self._scan())
+        size = sum(file_size for _, file_size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, file_size, path in files:
+            if size <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= file_size
+        self._size = size
+
+
+_caches = {}
+_caches_lock = Lock()
+
+
+def get_resize_cache():
+    """Returns ResizeCache for IMAGE_RESIZE_CACHE_DIR and IMAGE_RESIZE_CACHE_MAX_BYTES"""
+    directory = str(settings.IMAGE_RESIZE_CACHE_DIR)
+    max_bytes = settings.IMAGE_RESIZE_CACHE_MAX_BYTES
+    with _caches_lock:
+        if (directory, max_bytes) not in _caches:
+            _caches[(directory, max_bytes)] = ResizeCache(directory, max_bytes)
+        return _caches[(directory, max_bytes)]
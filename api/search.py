@@ -0,0 +1,207 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import OperationalError, connections
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+# Text search configuration used by search_vector triggers
+SEARCH_CONFIG = 'russian'
+
+# Weighted text fields included in full-text index of a model
+SEARCH_FIELDS = [
+    ('name', 'A'),
+    ('short_description', 'B'),
+    ('long_description', 'C'),
+]
+
+# bm25 column weights of SQLite FTS5 table, by SEARCH_FIELDS weight
+FTS_WEIGHTS = {'A': 10.0, 'B': 4.0, 'C': 1.0}
+
+# Cache of full-text table existence: {(alias, db name, table): bool}
+_fts_tables = {}
+
+
+def get_fts_table(model):
+    """Returns name of SQLite FTS5 table for model"""
+    return f'{model._meta.db_table}_fts'
+
+
+def has_fts_table(connection, model):
+    """Checks if SQLite FTS5 table for model exists in database"""
+    table = get_fts_table(model)
+    key = (connection.alias, connection.settings_dict['NAME'], table)
+    if key not in _fts_tables:
+        with connection.cursor() as cursor:
+            _fts_tables[key] = table in connection.introspection.table_names(cursor)
+    return _fts_tables[key]
+
+
+def get_search_words(search_terms):
+    """
+    Returns words of search terms. Both backends match every word as a
+    prefix and require all words, so they return the same rows.
+    """
+    return [word for term in search_terms for word in re.findall(r'\w+', term)]
+
+
+def get_fts_match(words):
+    """Returns FTS5 MATCH expression, every word is a quoted prefix"""
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def get_tsquery(words):
+    """Returns PostgreSQL tsquery text, every word is a quoted prefix"""
+    return ' & '.join(f"'{word}':*" for word in words)
+
+
+def _install_postgresql(cursor, model):
+    table = model._meta.db_table
+    vector = ' || '.join(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', "
+        f"regexp_replace(coalesce(NEW.{field}, ''), '<[^>]+>', ' ', 'g')), '{weight}')"
+        for field, weight in SEARCH_FIELDS
+    )
+    columns = ', '.join(field for field, _ in SEARCH_FIELDS)
+    cursor.execute(f'''
+        CREATE OR REPLACE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {vector};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql''')
+    cursor.execute(f'DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}')
+    cursor.execute(f'''
+        CREATE TRIGGER {table}_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF {columns} ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE {table}_search_vector_update()''')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {table}_search_vector_gin ON {table} USING GIN (search_vector)')
+    # Fires trigger for rows indexed before it existed
+    cursor.execute(f'UPDATE {table} SET name = name WHERE search_vector IS NULL')
+
+
+def _install_sqlite(cursor, model):
+    table = model._meta.db_table
+    fts_table = get_fts_table(model)
+    columns = ', '.join(field for field, _ in SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{field}' for field, _ in SEARCH_FIELDS)
+    old_values = ', '.join(f'old.{field}' for field, _ in SEARCH_FIELDS)
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table}
+        USING fts5({columns}, content='{table}', content_rowid='id')''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts_table}(rowid, {columns}) VALUES (new.id, {new_values});
+        END''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_update AFTER UPDATE ON {table} BEGIN
+            INSERT INTO {fts_table}({fts_table}, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts_table}(rowid, {columns}) VALUES (new.id, {new_values});
+        END''')
+    cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+
+def install_search_index(connection, models):
+    """
+    Creates full-text index objects for models, is safe to run repeatedly.
+    PostgreSQL: trigger maintained search_vector and GIN index.
+    SQLite: external content FTS5 table with triggers, if FTS5 available.
+    """
+    with connection.cursor() as cursor:
+        for model in models:
+            if connection.vendor == 'postgresql':
+                _install_postgresql(cursor, model)
+            elif connection.vendor == 'sqlite':
+                try:
+                    _install_sqlite(cursor, model)
+                except OperationalError:
+                    # SQLite is built without FTS5, SearchFilter is used
+                    pass
+    _fts_tables.clear()
+
+
+def uninstall_search_index(connection, models):
+    """Drops full-text index objects for models"""
+    with connection.cursor() as cursor:
+        for model in models:
+            table = model._meta.db_table
+            if connection.vendor == 'postgresql':
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_search_vector_gin')
+                cursor.execute(f'DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table}')
+                cursor.execute(f'DROP FUNCTION IF EXISTS {table}_search_vector_update()')
+            elif connection.vendor == 'sqlite':
+                fts_table = get_fts_table(model)
+                for suffix in ('insert', 'delete', 'update'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {fts_table}_{suffix}')
+                cursor.execute(f'DROP TABLE IF EXISTS {fts_table}')
+    _fts_tables.clear()
+
+
+def ensure_search_index(sender, using, **kwargs):
+    """
+    post_migrate receiver. SQLite drops triggers when a migration remakes
+    the table, so they are recreated if FTS5 table is in place.
+    """
+    from .models import Card, Collection
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    models = [model for model in (Card, Collection) if has_fts_table(connection, model)]
+    if models:
+        install_search_index(connection, models)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Search filter using full-text index of searched model.
+    On PostgreSQL uses search_vector column (russian stemming, GIN index),
+    on SQLite uses FTS5 table, both ranked by relevance. Every word of the
+    search must match as a prefix on both backends. Falls back to
+    SearchFilter with search_fields if there is no full-text index.
+    View may set search_relation to search on a related model.
+    """
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+
+        relation = getattr(view, 'search_relation', None)
+        prefix = f'{relation}__' if relation else ''
+        model = queryset.model
+        if relation:
+            model = model._meta.get_field(relation).related_model
+
+        connection = connections[queryset.db]
+        words = get_search_words(search_terms)
+        if connection.vendor == 'postgresql':
+            if not words:
+                return queryset.none()
+            query = SearchQuery(get_tsquery(words), config=SEARCH_CONFIG, search_type='raw')
+            queryset = (queryset
+                        .filter(**{f'{prefix}search_vector': query})
+                        .annotate(search_rank=SearchRank(F(f'{prefix}search_vector'), query)))
+        elif connection.vendor == 'sqlite' and has_fts_table(connection, model):
+            if not words:
+                return queryset.none()
+            fts_table = get_fts_table(model)
+            match = get_fts_match(words)
+            opts = queryset.model._meta
+            field = opts.get_field(relation) if relation else opts.pk
+            matched_sql = f'SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s'
+            weights = ', '.join(str(FTS_WEIGHTS[weight]) for _, weight in SEARCH_FIELDS)
+            rank_sql = (f'SELECT -bm25({fts_table}, {weights}) FROM {fts_table} WHERE {fts_table} MATCH %s '
+                        f'AND rowid = "{opts.db_table}"."{field.column}"')
+            queryset = (queryset
+                        .filter(**{f'{field.attname}__in': RawSQL(matched_sql, [match])})
+                        .annotate(search_rank=RawSQL(rank_sql, [match])))
+        else:
+            return super().filter_queryset(request, queryset, view)
+
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ['pk']
+        return queryset.order_by('-search_rank', *ordering)
@@ -1,9 +1,13 @@
 from rest_framework import serializers
 from .models import Card, Collection, CardEntry, Profile
+from .aggregates import parse_ids
+from .derivatives import get_derivative_urls
+from .metrics import MetricsSerializerMixin
+from .sparse import SparseFieldsSerializerMixin
 from django.contrib.auth.models import User
 
 
-class SignUpSerializer(serializers.ModelSerializer):
+class SignUpSerializer(MetricsSerializerMixin, serializers.ModelSerializer):
     """Serializer fo signing up"""
     password2 = serializers.CharField(write_only=True)
 
@@ -28,36 +32,91 @@ class SignUpSerializer(serializers.ModelSerializer):
         return user
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(MetricsSerializerMixin, serializers.ModelSerializer):
     """Serializer for User entity"""
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'date_joined']
 
 
-class ProfileSerializer(serializers.ModelSerializer):
-    """Serializer for Profile entity"""
+class ProfileSerializer(MetricsSerializerMixin, SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    """Serializer for Profile entity. ID lists may be left out with ?omit=cards,collections"""
     class Meta:
         model = Profile
-        fields = '__all__'
+        exclude = ['owned_cards', 'n_cards', 'n_collections']
+
 
+class CardSerializer(MetricsSerializerMixin, SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    """Serializer for Card entity. Lists leave out rich text unless asked in ?fields="""
+    derivatives = serializers.SerializerMethodField()
 
-class CardSerializer(serializers.ModelSerializer):
-    """Serializer for Card entity"""
     class Meta:
         model = Card
-        fields = '__all__'
+        exclude = ['search_vector', 'rendered_images']
+        list_omit = ['long_description']
+        method_field_sources = {'derivatives': ['image', 'rendered_images']}
+
+    def get_derivatives(self, obj):
+        request = self.context.get('request')
+        return {'image': get_derivative_urls(obj.image.name, obj.rendered_images, request)}
+
+
+class OwnedCardSerializer(CardSerializer):
+    """Serializer for Card entity with 'owned' flag annotated for User"""
+    owned = serializers.BooleanField(read_only=True)
+
+    class Meta(CardSerializer.Meta):
+        pass
+
 
+class CollectionSerializer(MetricsSerializerMixin, SparseFieldsSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for Collection entity. Lists leave out rich text unless asked in ?fields=
+    With 'cards' in context 'expand' cards are embedded with 'owned' flag and
+    'progress' is added, cards must be prefetched with 'owned' annotation.
+    """
+    derivatives = serializers.SerializerMethodField()
 
-class CollectionSerializer(serializers.ModelSerializer):
-    """Serializer for Collection entity"""
     class Meta:
         model = Collection
-        fields = '__all__'
+        exclude = ['search_vector', 'rendered_images']
+        list_omit = ['long_description']
+        method_field_sources = {'derivatives': ['image1', 'image2', 'image3', 'rendered_images']}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if 'cards' in fields and 'cards' in self.context.get('expand', ()):
+            fields['cards'] = OwnedCardSerializer(many=True, read_only=True)
+            fields['progress'] = serializers.SerializerMethodField()
+        return fields
+
+    def get_derivatives(self, obj):
+        request = self.context.get('request')
+        return {field: get_derivative_urls(getattr(obj, field).name, obj.rendered_images, request)
+                for field in ('image1', 'image2', 'image3')}
+
+    def get_progress(self, obj):
+        cards = obj.cards.all()
+        owned_count = sum(1 for card in cards if card.owned)
+        return {'owned_count': owned_count,
+                'n_cards': len(cards),
+                'completed': owned_count >= len(cards)}
 
 
-class CardEntrySerializer(serializers.ModelSerializer):
+class CardEntrySerializer(MetricsSerializerMixin, serializers.ModelSerializer):
     """Serializer for CardEntry entity"""
     class Meta:
         model = CardEntry
         fields = '__all__'
+
+
+class InventoryCardSerializer(MetricsSerializerMixin, serializers.Serializer):
+    """Serializer for Card grouped with CardEntry objects of User"""
+    card = CardSerializer(source='*')
+    count = serializers.IntegerField(source='entry_count')
+    first_acquired = serializers.DateTimeField()
+    last_acquired = serializers.DateTimeField()
+    entries = serializers.SerializerMethodField()
+
+    def get_entries(self, obj):
+        return parse_ids(obj.entry_ids)
@@ -0,0 +1,78 @@
+from rest_framework import serializers
+
+# Query parameters with comma separated field names
+FIELDS_QUERY_PARAM = 'fields'
+OMIT_QUERY_PARAM = 'omit'
+EXPAND_QUERY_PARAM = 'expand'
+
+
+def parse_field_names(request, param):
+    """Returns set of field names in query parameter, None if it is not given"""
+    if request is None or param not in request.query_params:
+        return None
+    return {name.strip() for name in request.query_params[param].split(',') if name.strip()}
+
+
+class SparseFieldsSerializerMixin:
+    """
+    ModelSerializer mixin selecting fields by ?fields= and ?omit= query
+    parameters of top-level serializer. 'id' is always kept. In lists, also
+    nested ones, or with 'lightweight' in context Meta.list_omit fields are
+    left out unless they are asked for in ?fields=. Meta.method_field_sources maps method
+    fields to model fields they read, so unused columns may be deferred.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request') if self.is_top_level() else None
+        selected = parse_field_names(request, FIELDS_QUERY_PARAM)
+        omitted = parse_field_names(request, OMIT_QUERY_PARAM) or set()
+        if selected is None:
+            selected = set(fields)
+            if self.is_lightweight():
+                omitted |= set(getattr(self.Meta, 'list_omit', ()))
+        return {name: field for name, field in fields.items()
+                if name == 'id' or (name in selected and name not in omitted)}
+
+    def is_top_level(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def is_lightweight(self):
+        parent = self.parent
+        while parent is not None:
+            if isinstance(parent, serializers.ListSerializer):
+                return True
+            parent = parent.parent
+        return self.context.get('lightweight', False)
+
+    def get_deferred_model_fields(self):
+        """Returns names of model columns not read by selected fields"""
+        method_field_sources = getattr(self.Meta, 'method_field_sources', {})
+        used = set()
+        for name, field in self.fields.items():
+            used.update(method_field_sources.get(name, ()))
+            used.add(field.source.split('.')[0])
+        return [field.name for field in self.Meta.model._meta.concrete_fields
+                if not field.primary_key and field.name not in used]
+
+
+class SparseFieldsViewMixin:
+    """
+    View mixin deferring model columns not read by serializer with sparse
+    fields in list and retrieve. Ordering and keyset pagination fields are
+    never deferred.
+    """
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if getattr(self, 'action', None) not in ('list', 'retrieve'):
+            return queryset
+        serializer = self.get_serializer(many=self.action == 'list')
+        serializer = getattr(serializer, 'child', serializer)
+
+        kept = {field.lstrip('-').split('__')[0] for field in queryset.query.order_by}
+        keyset_ordering = getattr(self.pagination_class, 'keyset_ordering', ())
+        kept.update(field.lstrip('-').split('__')[0] for field in keyset_ordering)
+        deferred = [name for name in serializer.get_deferred_model_fields() if name not in kept]
+        return queryset.defer(*deferred) if deferred else queryset
@@ -1,3 +1,1356 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.http import Http404, HttpResponse
+from django.test import AsyncClient, Client, RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLResolver, get_resolver, resolve
+from django.utils.dateparse import parse_datetime
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .card_pool import card_pool, get_card_pool_version
+from .catalog_cache import get_catalog_counts
+from .counters import rebuild_profile_counters
+from .derivatives import get_derivative_urls, get_thumbnail_name, render_derivatives
+from .dust import DUST_REASON_CRAFT, DUST_REASON_TURN_TO_DUST, NotEnoughDust, change_dust, rebuild_dust
+from .media import CONTENT_HASH_LENGTH, IMMUTABLE_CACHE_CONTROL, ContentHashStorage, is_content_addressed, serve_media
+from .metrics import registry
+from .models import Card, CardEntry, Collection, CollectionProgress, DailyClaim, DustTransaction, Profile
+from .ownership import card_ids_to_bitmap, owned_card_ids, owns_card, rebuild_owned_cards
+from .profiling import ProfilingMiddleware
+from .progress import get_completed_collection_ids, get_owned_count, rebuild_collection_progress
+from .resize import ResizeCache
+from .search import get_fts_match, get_search_words, get_tsquery, has_fts_table
+from .serializers import CardSerializer
+from .views import (ERROR_ADD_CARD_DAILY_REFUSED, ERROR_OPEN_PACK_COUNT_INCORRECT, ERROR_OPEN_PACK_DAILY_REFUSED,
+                    CardsBulkView, OpenPackView, get_daily_claim_day)
+
+# Size of synthetic dataset, number of users may be raised for bigger runs
+N_USERS = int(os.environ.get('BENCHMARK_USERS', 2000))
+N_COLLECTIONS = 20
+CARDS_PER_COLLECTION = 25
+N_LOOSE_CARDS = 100
+OWNED_PER_USER = 20
+ENTRIES_PER_USER = 10
+
+# Timed requests per route and file with benchmark results
+BENCHMARK_ITERATIONS = int(os.environ.get('BENCHMARK_ITERATIONS', 20))
+BENCHMARK_OUTPUT = os.environ.get('BENCHMARK_OUTPUT', os.path.join(settings.BASE_DIR, 'benchmark_results.json'))
+
+# Rarities of generated cards, in proportion of card_pool.RARITY_CHANCES
+RARITIES = ['common'] * 7 + ['rare'] * 2 + ['epic']
+
+# Dust of benchmark user, enough to craft any card every iteration
+BENCHMARK_USER_DUST = 10 ** 6
+
+# Maximum number of SQL queries by route of api.urls, with empty cache.
+# Counts include SAVEPOINT and RELEASE queries of transaction.atomic,
+# as tests run in a transaction.
+QUERY_BUDGETS = {
+    '^cards/$': 3,
+    '^cards/(?P<id>[^/.]+)/$': 2,
+    '^collections/$': 4,
+    '^collections/(?P<id>[^/.]+)/$': 3,
+    '^my/cards/$': 3,
+    '^my/cards/(?P<id>[^/.]+)/$': 2,
+    '^my/inventory/$': 3,
+    '^my/inventory/(?P<id>[^/.]+)/$': 2,
+    '^$': 1,
+    'signup/': 5,
+    'user/': 1,
+    'profile/': 4,
+    'dashboard/': 6,
+    # First card of a Collection creates progress record with SAVEPOINT, INSERT
+    # and RELEASE, otherwise 12 queries
+    'add_card_to_collection/<int:entry_id>': 15,
+    # Progress of all affected collections is updated with one query
+    'add_cards_to_collection_bulk/': 14,
+    'add_card/': 5,
+    'add_card_admin/': 2,
+    'open_pack/': 4,
+    'craft_card/<int:card_id>': 9,
+    'turn_to_dust/<int:entry_id>': 9,
+    'turn_to_dust_bulk/': 11,
+    'cards_bulk/': 3,
+    'collection_progress/<int:collection_id>': 5,
+    'get_user_statistics/': 4,
+    'is_addable/<int:entry_id>': 4,
+    'is_daily_card_available/': 2,
+    'is_craftable/<int:card_id>': 3,
+    'eligibility_bulk/': 4,
+    'images/<path:name>': 0,
+}
+
+
+def generate_dataset(n_users=N_USERS, n_collections=N_COLLECTIONS, cards_per_collection=CARDS_PER_COLLECTION,
+                     n_loose_cards=N_LOOSE_CARDS, owned_per_user=OWNED_PER_USER,
+                     entries_per_user=ENTRIES_PER_USER, seed=0):
+    """
+    Creates synthetic Users with Profiles, Collections with Cards, owned
+    Cards (Profile.cards) and CardEntry objects with bulk_create. Signals do
+    not run for bulk inserts, so maintained fields are rebuilt afterwards.
+    Returns dict with numbers of created objects.
+    """
+    rng = random.Random(seed)
+    password = make_password(None)
+    User.objects.bulk_create(User(username=f'bench{i}', password=password) for i in range(n_users))
+    user_ids = list(User.objects.filter(username__startswith='bench').order_by('id').values_list('id', flat=True))
+    Profile.objects.bulk_create(Profile(user_id=user_id) for user_id in user_ids)
+    profile_ids = dict(Profile.objects.filter(user_id__in=user_ids).values_list('user_id', 'id'))
+
+    Collection.objects.bulk_create(
+        Collection(name=f'Collection {i}', short_description=f'Collection {i}',
+                   long_description=f'<p>Collection {i}</p>', n_cards=cards_per_collection,
+                   image1=f'collections/{i}.jpg')
+        for i in range(n_collections))
+    collection_ids = list(Collection.objects.order_by('id').values_list('id', flat=True))
+
+    n_cards = n_collections * cards_per_collection + n_loose_cards
+    Card.objects.bulk_create(
+        Card(name=f'Card {i}', short_description=f'Card {i}', long_description=f'<p>Card {i}</p>',
+             image=f'cards/{i}.jpg', rarity=RARITIES[i % len(RARITIES)],
+             related_collection_id=(collection_ids[i // cards_per_collection]
+                                    if i < n_collections * cards_per_collection else None))
+        for i in range(n_cards))
+    card_ids = list(Card.objects.order_by('id').values_list('id', flat=True))
+    Collection.cards.through.objects.bulk_create(
+        Collection.cards.through(collection_id=collection_ids[i // cards_per_collection], card_id=card_id)
+        for i, card_id in enumerate(card_ids[:n_collections * cards_per_collection]))
+
+    owned = []
+    entries = []
+    for user_id in user_ids:
+        for card_id in rng.sample(card_ids, owned_per_user):
+            owned.append(Profile.cards.through(profile_id=profile_ids[user_id], card_id=card_id))
+        for card_id in rng.choices(card_ids, k=entries_per_user):
+            entries.append(CardEntry(user_id=user_id, card_id=card_id, source='pack'))
+    Profile.cards.through.objects.bulk_create(owned, batch_size=5000)
+    CardEntry.objects.bulk_create(entries, batch_size=5000)
+    DustTransaction.objects.bulk_create(
+        (DustTransaction(profile_id=profile_id, amount=rng.randint(0, 500), reason='opening_balance')
+         for profile_id in profile_ids.values()), batch_size=5000)
+
+    rebuild_owned_cards()
+    rebuild_collection_progress()
+    rebuild_profile_counters()
+    rebuild_dust()
+    cache.clear()
+    card_pool.invalidate()
+    return {'users': len(user_ids), 'collections': len(collection_ids), 'cards': len(card_ids),
+            'owned_cards': len(owned), 'card_entries': len(entries)}
+
+
+def join_route(route1, route2):
+    """Joins routes of included URL patterns like ResolverMatch.route"""
+    if not route1:
+        return route2
+    if route2.startswith('^'):
+        route2 = route2[1:]
+    return route1 + route2
+
+
+def get_api_routes(patterns=None, prefix=''):
+    """Returns routes of api.urls as in ResolverMatch.route, without format suffix routes"""
+    if patterns is None:
+        patterns = get_resolver('api.urls').url_patterns
+    routes = []
+    for pattern in patterns:
+        route = join_route(prefix, str(pattern.pattern))
+        if isinstance(pattern, URLResolver):
+            routes.extend(get_api_routes(pattern.url_patterns, route))
+        elif '(?P<format>' not in route:
+            routes.append(route)
+    return routes
+
+
+def get_percentiles(times):
+    """Returns p50, p90 and p99 of durations in milliseconds"""
+    quantiles = statistics.quantiles([duration * 1000 for duration in times], n=100, method='inclusive')
+    return {'p50_ms': quantiles[49], 'p90_ms': quantiles[89], 'p99_ms': quantiles[98]}
+
+
+def get_commit():
+    """Returns git commit of working tree, None outside of git repository"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class ApiTestCase(TestCase):
+    """Base of API tests: User with Profile, Collection of three cards and client authenticated by JWT"""
+    def setUp(self):
+        cache.clear()
+        card_pool.invalidate()
+        self.user = User.objects.create(username='user')
+        self.profile = self.user.profile
+        self.collection = Collection.objects.create(name='Collection', short_description='Collection',
+                                                    long_description='<p>Collection</p>')
+        self.cards = [Card.objects.create(name=f'Card {rarity}', short_description=rarity,
+                                          long_description=f'<p>{rarity}</p>', rarity=rarity,
+                                          related_collection=self.collection)
+                      for rarity in ('common', 'rare', 'epic')]
+        self.collection.cards.add(*self.cards)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def create_entry(self, card, user=None):
+        return CardEntry.objects.create(user=user or self.user, card=card, source='pack')
+
+    def refresh_profile(self):
+        self.profile = Profile.objects.get(id=self.profile.id)
+        return self.profile
+
+
+class OwnershipTest(ApiTestCase):
+    """Owned cards bitmap follows Profile.cards"""
+    def assert_ownership(self):
+        profile = self.refresh_profile()
+        owned = set(profile.cards.values_list('id', flat=True))
+        for card in self.cards:
+            self.assertEqual(owns_card(profile, card.id), card.id in owned, card.name)
+        self.assertEqual(owned_card_ids(profile), owned)
+
+    def test_add(self):
+        self.profile.cards.add(self.cards[0], self.cards[2])
+        self.assert_ownership()
+
+    def test_remove(self):
+        self.profile.cards.add(*self.cards)
+        self.profile.cards.remove(self.cards[1])
+        self.assert_ownership()
+
+    def test_clear(self):
+        self.profile.cards.add(*self.cards)
+        self.profile.cards.clear()
+        self.assert_ownership()
+        self.assertEqual(self.profile.owned_cards, b'')
+
+    def test_reverse_add_remove_clear(self):
+        other = User.objects.create(username='other').profile
+        self.cards[0].profile_set.add(self.profile, other)
+        self.cards[1].profile_set.add(self.profile)
+        self.assert_ownership()
+        self.assertTrue(owns_card(Profile.objects.get(id=other.id), self.cards[0].id))
+        self.cards[1].profile_set.remove(self.profile)
+        self.assert_ownership()
+        self.cards[0].profile_set.clear()
+        self.assert_ownership()
+        self.assertFalse(owns_card(Profile.objects.get(id=other.id), self.cards[0].id))
+
+    def test_add_card_to_collection(self):
+        entry = self.create_entry(self.cards[0])
+        response = self.client.post(f'/api/add_card_to_collection/{entry.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CardEntry.objects.filter(id=entry.id).exists())
+        self.assert_ownership()
+        self.assertTrue(owns_card(self.profile, self.cards[0].id))
+
+        # Card is owned, so second entry is refused and stays
+        entry = self.create_entry(self.cards[0])
+        response = self.client.post(f'/api/add_card_to_collection/{entry.id}')
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(CardEntry.objects.filter(id=entry.id).exists())
+
+    def test_turn_to_dust_keeps_ownership(self):
+        self.profile.cards.add(self.cards[0])
+        entry = self.create_entry(self.cards[0])
+        response = self.client.delete(f'/api/turn_to_dust/{entry.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(CardEntry.objects.filter(id=entry.id).exists())
+        self.assert_ownership()
+        self.assertTrue(owns_card(self.profile, self.cards[0].id))
+
+    def test_rebuild_owned_cards(self):
+        self.profile.cards.add(self.cards[0], self.cards[1])
+        Profile.objects.filter(id=self.profile.id).update(owned_cards=card_ids_to_bitmap([self.cards[2].id]))
+        rebuild_owned_cards([self.profile.id])
+        self.assert_ownership()
+
+
+class DailyClaimTest(ApiTestCase):
+    """Daily card may be claimed once a day (UTC)"""
+    def test_second_claim_refused(self):
+        response = self.client.get('/api/is_daily_card_available/')
+        self.assertEqual(response.data, {'result': 'true'})
+
+        response = self.client.post('/api/add_card/?source=daily')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/is_daily_card_available/')
+        self.assertEqual(response.data, {'result': 'false'})
+
+        response = self.client.post('/api/add_card/?source=daily')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': ERROR_ADD_CARD_DAILY_REFUSED})
+        self.assertEqual(CardEntry.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(DailyClaim.objects.filter(user=self.user).count(), 1)
+
+    def test_claim_next_day(self):
+        DailyClaim.objects.create(user=self.user, day=get_daily_claim_day() - datetime.timedelta(days=1))
+        response = self.client.post('/api/add_card/?source=daily')
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_sources_not_limited(self):
+        for _ in range(2):
+            response = self.client.post('/api/add_card/?source=pack')
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse(DailyClaim.objects.filter(user=self.user).exists())
+
+
+class OpenPackTest(ApiTestCase):
+    """Pack opening creates count entries, refuses daily source and wrong counts"""
+    def test_open_pack(self):
+        response = self.client.post('/api/open_pack/?source=pack&count=7')
+        self.assertEqual(response.status_code, 200)
+        entries = CardEntry.objects.filter(user=self.user)
+        self.assertEqual(entries.count(), 7)
+        self.assertEqual({entry['id'] for entry in response.data['cards']}, set(entries.values_list('id', flat=True)))
+        self.assertTrue(all(entry.source == 'pack' for entry in entries))
+        self.assertLessEqual({entry.card_id for entry in entries}, {card.id for card in self.cards})
+
+    def test_default_count(self):
+        response = self.client.post('/api/open_pack/?source=pack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['cards']), OpenPackView.min_count)
+
+    def test_count_bounds(self):
+        for count in (OpenPackView.min_count, OpenPackView.max_count):
+            response = self.client.post(f'/api/open_pack/?source=pack&count={count}')
+            self.assertEqual(len(response.data['cards']), count)
+        CardEntry.objects.all().delete()
+        for count in (OpenPackView.min_count - 1, OpenPackView.max_count + 1, 'many'):
+            response = self.client.post(f'/api/open_pack/?source=pack&count={count}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], ERROR_OPEN_PACK_COUNT_INCORRECT)
+        self.assertFalse(CardEntry.objects.exists())
+
+    def test_source(self):
+        response = self.client.post('/api/open_pack/?source=daily')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], ERROR_OPEN_PACK_DAILY_REFUSED)
+        self.assertEqual(self.client.post('/api/open_pack/').status_code, 400)
+        self.assertFalse(CardEntry.objects.exists())
+        self.assertFalse(DailyClaim.objects.exists())
+
+
+class CollectionProgressTest(ApiTestCase):
+    """Collection.n_cards and progress follow Collection cards, also when Card is deleted"""
+    def test_collection_cards(self):
+        self.profile.cards.add(*self.cards)
+        self.assertEqual(get_completed_collection_ids(self.profile, [self.collection.id]), [self.collection.id])
+        card = Card.objects.create(name='Card', short_description='Card', long_description='<p>Card</p>')
+        self.collection.cards.add(card)
+        self.assertEqual(Collection.objects.get(id=self.collection.id).n_cards, 4)
+        self.assertEqual(get_completed_collection_ids(self.profile, [self.collection.id]), [])
+
+    def test_card_deleted(self):
+        self.profile.cards.add(self.cards[0], self.cards[1])
+        self.cards[2].delete()
+        self.assertEqual(Collection.objects.get(id=self.collection.id).n_cards, 2)
+        self.assertEqual(get_owned_count(self.profile, self.collection), 2)
+        self.assertEqual(get_completed_collection_ids(self.profile, [self.collection.id]), [self.collection.id])
+
+    def test_owned_card_deleted(self):
+        self.profile.cards.add(*self.cards)
+        self.cards[0].delete()
+        self.assertEqual(get_owned_count(self.profile, self.collection), 2)
+        self.assertEqual(get_completed_collection_ids(self.profile, [self.collection.id]), [self.collection.id])
+
+
+class CardPoolTest(ApiTestCase):
+    """Card pool is invalidated after commit of Card changes"""
+    def test_invalidated_on_commit(self):
+        self.assertEqual(list(card_pool.get_buckets()['epic']), [self.cards[2].id])
+        version = get_card_pool_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            card = Card.objects.create(name='Card', short_description='Card', long_description='<p>Card</p>',
+                                       rarity='epic')
+            self.cards[2].delete()
+            self.assertEqual(get_card_pool_version(), version)
+        self.assertNotEqual(get_card_pool_version(), version)
+        self.assertEqual(list(card_pool.get_buckets()['epic']), [card.id])
+        self.assertEqual(card_pool.draw('epic'), card.id)
+
+
+class CatalogCacheTest(ApiTestCase):
+    """Catalog responses and counts change after commit of Card or Collection changes"""
+    def test_etag_changed(self):
+        path = f'/api/cards/{self.cards[0].id}/'
+        response = self.client.get(path)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cards[0].name = 'Renamed'
+            self.cards[0].save()
+            # Not committed yet, cached response is still served
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['name'], 'Renamed')
+
+    def test_collection_cards_changed(self):
+        path = f'/api/collections/{self.collection.id}/'
+        etag = self.client.get(path)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.collection.cards.remove(self.cards[0])
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.cards[0].id, response.data['cards'])
+
+    def test_counts(self):
+        self.assertEqual(get_catalog_counts(), {'n_cards': 3, 'n_collections': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            Card.objects.create(name='Card', short_description='Card', long_description='<p>Card</p>')
+        self.assertEqual(get_catalog_counts(), {'n_cards': 4, 'n_collections': 1})
+
+
+class AddCardsToCollectionBulkTest(ApiTestCase):
+    """Bulk add consumes new cards, skips duplicates and records completion once"""
+    def post(self, entries):
+        return self.client.post('/api/add_cards_to_collection_bulk/', {'entries': entries}, format='json')
+
+    def test_add(self):
+        self.profile.cards.add(self.cards[0])
+        owned = self.create_entry(self.cards[0])
+        first = self.create_entry(self.cards[1])
+        repeated = self.create_entry(self.cards[1])
+        response = self.post([owned.id, first.id, repeated.id])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([card['id'] for card in response.data['cards']], [self.cards[1].id])
+        self.assertEqual(response.data['skipped'], [owned.id, repeated.id])
+        self.assertEqual(response.data['completed_collections'], [])
+        self.assertEqual(set(CardEntry.objects.values_list('id', flat=True)), {owned.id, repeated.id})
+        self.assertTrue(owns_card(self.refresh_profile(), self.cards[1].id))
+
+    def test_completion(self):
+        self.profile.cards.add(self.cards[0])
+        response = self.post([self.create_entry(card).id for card in self.cards[1:]])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['completed_collections'], [self.collection.id])
+        self.assertEqual(list(self.profile.collections.values_list('id', flat=True)), [self.collection.id])
+        self.assertFalse(CardEntry.objects.exists())
+
+    def test_other_user(self):
+        other = User.objects.create(username='other')
+        entries = [self.create_entry(self.cards[0]).id, self.create_entry(self.cards[1], user=other).id]
+        response = self.post(entries)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(CardEntry.objects.count(), 2)
+        self.assertFalse(self.profile.cards.exists())
+
+    def test_incorrect(self):
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post(['1']).status_code, 400)
+        self.assertEqual(self.post([self.create_entry(self.cards[0]).id, 0]).status_code, 400)
+        self.assertFalse(self.profile.cards.exists())
+
+
+class CardsBulkTest(ApiTestCase):
+    """cards_bulk returns cards in request order with addable flag and missing IDs"""
+    def test_request_order(self):
+        self.profile.cards.add(self.cards[1])
+        card_ids = [self.cards[2].id, self.cards[1].id, 0, self.cards[2].id]
+        response = self.client.post('/api/cards_bulk/', {'cards': card_ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['card']['id'] for item in response.data['results']],
+                         [self.cards[2].id, self.cards[1].id, self.cards[2].id])
+        self.assertEqual([item['addable'] for item in response.data['results']], ['true', 'false', 'true'])
+        self.assertEqual(response.data['missing'], [0])
+        self.assertNotIn('long_description', response.data['results'][0]['card'])
+
+    def test_rarity_ordering(self):
+        card_ids = [card.id for card in self.cards]
+        response = self.client.post('/api/cards_bulk/', {'cards': card_ids, 'ordering': 'rarity'})
+        self.assertEqual([item['card']['rarity'] for item in response.data['results']], ['epic', 'rare', 'common'])
+
+    def test_string_ids(self):
+        response = self.client.post('/api/cards_bulk/', {'cards': [str(self.cards[0].id)]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['card']['id'], self.cards[0].id)
+
+    def test_incorrect_ids(self):
+        for cards in (['card'], [None], 'cards'):
+            response = self.client.post('/api/cards_bulk/', {'cards': cards})
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(ROOT_URLCONF='api.async_urls')
+    async def test_asgi(self):
+        # Response is built in the view thread, nothing is queried in event loop
+        authorization = self.client._credentials['HTTP_AUTHORIZATION']
+        response = await AsyncClient().post('/cards_bulk/', {'cards': [self.cards[0].id]},
+                                            content_type='application/json', authorization=authorization)
+        self.assertEqual(response.status_code, 200)
+        # ASGIHandler reads streaming content in event loop too
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(json.loads(content)['results'][0]['card']['id'], self.cards[0].id)
+
+
+@override_settings(ROOT_URLCONF='api.async_urls')
+class AsyncViewsTest(ApiTestCase):
+    """Views of api.async_urls answer like sync views of api.urls"""
+    def setUp(self):
+        super().setUp()
+        self.authorization = self.client._credentials['HTTP_AUTHORIZATION']
+        self.async_client = AsyncClient()
+
+    def get(self, path, **headers):
+        # AsyncClient takes headers by name, not as WSGI environ keys
+        return self.async_client.get(path, authorization=self.authorization, **headers)
+
+    async def test_read_views(self):
+        paths = ['/dashboard/', '/get_user_statistics/', '/is_daily_card_available/',
+                 f'/collection_progress/{self.collection.id}']
+        for path in paths:
+            response = await self.get(path)
+            self.assertEqual(response.status_code, 200, path)
+            with override_settings(ROOT_URLCONF='api.urls'):
+                expected = await sync_to_async(self.client.get)(path)
+            self.assertEqual(json.loads(response.content), json.loads(expected.content), path)
+
+    async def test_catalog_views(self):
+        for path in ['/cards/', f'/cards/{self.cards[0].id}/', '/collections/', f'/collections/{self.collection.id}/']:
+            # First request fills catalog cache in sync view, second is answered from cache
+            missed = await self.get(path)
+            cached = await self.get(path)
+            self.assertEqual(cached.status_code, 200, path)
+            self.assertEqual(json.loads(cached.content), json.loads(missed.content), path)
+            self.assertEqual(cached['ETag'], missed['ETag'], path)
+            response = await self.get(path, if_none_match=cached['ETag'])
+            self.assertEqual(response.status_code, 304, path)
+
+    async def test_authentication(self):
+        for path in ['/dashboard/', '/cards/']:
+            response = await AsyncClient().get(path)
+            self.assertEqual(response.status_code, 401, path)
+        response = await self.async_client.post('/dashboard/', authorization=self.authorization)
+        self.assertEqual(response.status_code, 405)
+
+
+class InventoryTest(ApiTestCase):
+    """Inventory groups CardEntry objects of User by Card"""
+    def setUp(self):
+        super().setUp()
+        self.entries = {card.id: [self.create_entry(card) for _ in range(count)]
+                        for card, count in zip(self.cards, (3, 1, 0))}
+        other = User.objects.create(username='other')
+        self.create_entry(self.cards[0], user=other)
+        self.create_entry(self.cards[2], user=other)
+
+    def assert_item(self, item):
+        entries = self.entries[item['card']['id']]
+        self.assertEqual(item['count'], len(entries))
+        self.assertEqual(sorted(item['entries']), [entry.id for entry in entries])
+        acquired = [entry.acquired for entry in entries]
+        self.assertEqual(parse_datetime(item['first_acquired']), min(acquired))
+        self.assertEqual(parse_datetime(item['last_acquired']), max(acquired))
+
+    def test_list(self):
+        response = self.client.get('/api/my/inventory/')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([item['card']['id'] for item in results], [self.cards[0].id, self.cards[1].id])
+        for item in results:
+            self.assert_item(item)
+        self.assertNotIn('long_description', results[0]['card'])
+
+    def test_retrieve(self):
+        response = self.client.get(f'/api/my/inventory/{self.cards[0].id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assert_item(response.data)
+        self.assertIn('long_description', response.data['card'])
+        self.assertEqual(self.client.get(f'/api/my/inventory/{self.cards[2].id}/').status_code, 404)
+
+
+class SearchTest(ApiTestCase):
+    """Full-text search matches every word as a prefix and orders by relevance"""
+    def setUp(self):
+        super().setUp()
+        self.dragon = Card.objects.create(name='Dragon', short_description='Card', long_description='<p>Card</p>')
+        self.knight = Card.objects.create(name='Knight', short_description='Dragon slayer',
+                                          long_description='<p>Card</p>')
+        self.wizard = Card.objects.create(name='Wizard', short_description='Card',
+                                          long_description='<p>Tames a dragon</p>')
+
+    def search(self, path, query):
+        response = self.client.get(path, {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_index_installed(self):
+        self.assertTrue(has_fts_table(connection, Card))
+        self.assertTrue(has_fts_table(connection, Collection))
+
+    def test_query_text(self):
+        words = get_search_words(['drag,', "o'neil"])
+        self.assertEqual(words, ['drag', 'o', 'neil'])
+        self.assertEqual(get_fts_match(words), '"drag"* "o"* "neil"*')
+        self.assertEqual(get_tsquery(words), "'drag':* & 'o':* & 'neil':*")
+
+    def test_relevance(self):
+        results = self.search('/api/cards/', 'drag')
+        self.assertEqual([card['id'] for card in results], [self.dragon.id, self.knight.id, self.wizard.id])
+
+    def test_every_word(self):
+        results = self.search('/api/cards/', 'drag slay')
+        self.assertEqual([card['id'] for card in results], [self.knight.id])
+        self.assertEqual(self.search('/api/cards/', '!!!'), [])
+
+    def test_my_cards(self):
+        entries = [self.create_entry(card) for card in (self.wizard, self.dragon, self.cards[0])]
+        results = self.search('/api/my/cards/', 'dragon')
+        self.assertEqual([entry['id'] for entry in results], [entries[1].id, entries[0].id])
+
+    def test_inventory(self):
+        for card in (self.wizard, self.knight, self.cards[0]):
+            self.create_entry(card)
+        results = self.search('/api/my/inventory/', 'dragon')
+        self.assertEqual([item['card']['id'] for item in results], [self.knight.id, self.wizard.id])
+
+
+class KeysetPaginationTest(ApiTestCase):
+    """Walking cursor pages returns every row exactly once, in both directions"""
+    max_pages = 50
+
+    def setUp(self):
+        super().setUp()
+        for i in range(7):
+            Collection.objects.create(name=f'Collection {i}', short_description='Collection',
+                                      long_description='<p>Collection</p>')
+            card = Card.objects.create(name=f'Card {i}', short_description='Card', long_description='<p>Card</p>')
+            self.cards.append(card)
+        for card in self.cards + self.cards[:3]:
+            self.create_entry(card)
+
+    def walk(self, url, key='id'):
+        """Returns row keys of forward walk and of backward walk from the last page"""
+        forward = []
+        pages = []
+        while url:
+            self.assertLess(len(pages), self.max_pages, 'Cursor pages do not end')
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            forward.extend(row[key] for row in response.data['results'])
+            url = response.data['next']
+        backward = list(pages[-1]['results'])
+        url = pages[-1]['previous']
+        for _ in range(self.max_pages):
+            if not url:
+                break
+            response = self.client.get(url)
+            backward[:0] = response.data['results']
+            url = response.data['previous']
+        return forward, [row[key] for row in backward]
+
+    def assert_walk(self, url, expected, key='id'):
+        forward, backward = self.walk(url, key)
+        self.assertEqual(forward, expected)
+        self.assertEqual(backward, expected)
+
+    def test_cards(self):
+        expected = list(Card.objects.order_by('id').values_list('id', flat=True))
+        self.assert_walk('/api/cards/?pagination=cursor&page_size=3', expected)
+
+    def test_collections(self):
+        # Collections are ordered by created, which has microseconds
+        expected = list(Collection.objects.order_by('created', 'id').values_list('id', flat=True))
+        self.assert_walk('/api/collections/?pagination=cursor&page_size=2', expected)
+
+    def test_my_cards(self):
+        expected = list(CardEntry.objects.filter(user=self.user).order_by('card__name', 'id')
+                        .values_list('id', flat=True))
+        self.assert_walk('/api/my/cards/?pagination=cursor&page_size=4', expected)
+
+    def test_inventory(self):
+        expected = list(Card.objects.order_by('name', 'id').values_list('id', flat=True))
+        forward, backward = self.walk('/api/my/inventory/?pagination=cursor&page_size=3', 'card')
+        self.assertEqual([card['id'] for card in forward], expected)
+        self.assertEqual([card['id'] for card in backward], expected)
+
+    def test_search_refused(self):
+        response = self.client.get('/api/cards/?search=Card&pagination=cursor')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/cards/?search=Card')
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/cards/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
+
+class SparseFieldsTest(ApiTestCase):
+    """?fields= and ?omit= select serialized fields and columns that are not deferred"""
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        card_sql = [query['sql'] for query in queries
+                    if query['sql'].startswith('SELECT "api_card"') and 'FROM "api_card"' in query['sql']]
+        self.assertEqual(len(card_sql), 1)
+        return response.data, card_sql[0]
+
+    def test_list(self):
+        data, sql = self.get('/api/cards/')
+        self.assertNotIn('long_description', data['results'][0])
+        self.assertIn('short_description', data['results'][0])
+        self.assertNotIn('"api_card"."long_description"', sql)
+        self.assertIn('"api_card"."short_description"', sql)
+
+    def test_fields(self):
+        data, sql = self.get('/api/cards/?fields=name,long_description')
+        self.assertEqual(set(data['results'][0]), {'id', 'name', 'long_description'})
+        self.assertIn('"api_card"."long_description"', sql)
+        for column in ('short_description', 'image', 'rendered_images', 'search_vector'):
+            self.assertNotIn(f'"api_card"."{column}"', sql)
+
+    def test_omit(self):
+        data, sql = self.get(f'/api/cards/{self.cards[0].id}/?omit=derivatives,image,long_description')
+        self.assertNotIn('derivatives', data)
+        self.assertNotIn('long_description', data)
+        self.assertIn('name', data)
+        for column in ('image', 'rendered_images', 'long_description'):
+            self.assertNotIn(f'"api_card"."{column}"', sql)
+
+    def test_derivatives_sources(self):
+        data, sql = self.get('/api/cards/?fields=derivatives')
+        self.assertEqual(set(data['results'][0]), {'id', 'derivatives'})
+        self.assertIn('"api_card"."image"', sql)
+        self.assertIn('"api_card"."rendered_images"', sql)
+        self.assertNotIn('"api_card"."name"', sql)
+
+    def test_cards_bulk(self):
+        response = self.client.post('/api/cards_bulk/?fields=name', {'cards': [self.cards[0].id]}, format='json')
+        self.assertEqual(set(response.data['results'][0]['card']), {'id', 'name'})
+
+    def test_profile(self):
+        self.assertIn('cards', self.client.get('/api/profile/').data['user'])
+        response = self.client.get('/api/profile/?omit=cards,collections')
+        self.assertEqual(set(response.data['user']), {'id', 'user', 'dust'})
+
+
+class CollectionExpandTest(ApiTestCase):
+    """?expand=cards embeds cards with 'owned' flag of User and progress, bypassing catalog cache"""
+    def setUp(self):
+        super().setUp()
+        self.path = f'/api/collections/{self.collection.id}/?expand=cards'
+
+    def test_owned(self):
+        self.profile.cards.add(self.cards[0])
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(card['id'], card['owned']) for card in response.data['cards']],
+                         [(self.cards[0].id, True), (self.cards[1].id, False), (self.cards[2].id, False)])
+        self.assertNotIn('long_description', response.data['cards'][0])
+        self.assertEqual(response.data['progress'], {'owned_count': 1, 'n_cards': 3, 'completed': False})
+
+    def test_list(self):
+        self.profile.cards.add(*self.cards)
+        response = self.client.get('/api/collections/?expand=cards')
+        self.assertEqual(response.status_code, 200)
+        collection = response.data['results'][0]
+        self.assertTrue(all(card['owned'] for card in collection['cards']))
+        self.assertEqual(collection['progress'], {'owned_count': 3, 'n_cards': 3, 'completed': True})
+
+    def test_not_cached(self):
+        response = self.client.get(self.path)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response.data['progress']['owned_count'], 0)
+
+        # Ownership changes do not bump catalog version
+        self.profile.cards.add(self.cards[1])
+        self.assertEqual(self.client.get(self.path).data['progress']['owned_count'], 1)
+
+        other = User.objects.create(username='other')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(other).access_token}')
+        response = client.get(self.path)
+        self.assertFalse(any(card['owned'] for card in response.data['cards']))
+
+    def test_without_expand(self):
+        response = self.client.get(f'/api/collections/{self.collection.id}/')
+        self.assertIn('ETag', response)
+        self.assertEqual(response.data['cards'], [card.id for card in self.cards])
+        self.assertNotIn('progress', response.data)
+
+
+class DerivativeUrlsTest(TestCase):
+    """Derivative URLs are advertised only for rendered files"""
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        Image.new('RGB', (640, 480), (200, 100, 50)).save(os.path.join(self.media_root, 'image.jpg'))
+
+    def test_original_until_rendered(self):
+        original = default_storage.url('image.jpg')
+        render_derivatives(self.media_root, 'image.jpg')
+        urls = get_derivative_urls('image.jpg', [])
+        self.assertEqual({url for url in urls['thumbnails']['240'].values()}, {original})
+
+        urls = get_derivative_urls('image.jpg', ['image.jpg'])
+        self.assertEqual(urls['thumbnails']['240']['jpg'],
+                         default_storage.url(get_thumbnail_name('image.jpg', 240, 'jpg')))
+
+    @override_settings(IMAGE_DERIVATIVES_ASYNC=False)
+    def test_rendered_on_save(self):
+        card = Card.objects.create(name='Card', short_description='Card', long_description='<p>Card</p>',
+                                   image='image.jpg')
+        card = Card.objects.get(id=card.id)
+        self.assertEqual(card.rendered_images, ['image.jpg'])
+        # URLs are built from rendered_images, without checking files
+        with mock.patch.object(default_storage, 'exists', side_effect=AssertionError):
+            derivatives = CardSerializer(card).data['derivatives']['image']
+        self.assertEqual(derivatives['thumbnails']['240']['jpg'],
+                         default_storage.url(get_thumbnail_name('image.jpg', 240, 'jpg')))
+
+        # Missing image is not rendered
+        card.image = 'missing.jpg'
+        card.save()
+        card = Card.objects.get(id=card.id)
+        self.assertNotIn('missing.jpg', card.rendered_images)
+        derivatives = CardSerializer(card).data['derivatives']['image']
+        self.assertEqual(derivatives['thumbnails']['240']['jpg'], default_storage.url('missing.jpg'))
+
+
+class ResizeCacheTest(TestCase):
+    """Concurrent requests for one variant render it once"""
+    def test_single_render(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        source = os.path.join(directory, 'image.jpg')
+        Image.new('RGB', (640, 480), (200, 100, 50)).save(source)
+        resize_cache = ResizeCache(os.path.join(directory, 'cache'), 10 ** 8)
+        renders = []
+        render = resize_cache._render
+
+        def slow_render(*args):
+            renders.append(args)
+            time.sleep(0.05)
+            render(*args)
+
+        resize_cache._render = slow_render
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: resize_cache.open(source, 'image.jpg', 240, 'jpg'), range(16)))
+        for image_file, _ in results:
+            image_file.close()
+        self.assertEqual(len(renders), 1)
+        self.assertEqual(resize_cache._locks, {})
+
+
+class ContentHashStorageTest(TestCase):
+    """Media files are saved under content hash names and served with immutable caching"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.storage = ContentHashStorage(location=self.directory)
+        self.factory = RequestFactory()
+
+    def test_content_name(self):
+        name = self.storage.save('cards/image.JPG', ContentFile(b'image'))
+        digest = hashlib.sha256(b'image').hexdigest()[:CONTENT_HASH_LENGTH]
+        self.assertEqual(name, f'cards/{digest}.jpg')
+        self.assertTrue(is_content_addressed(name))
+        self.assertNotEqual(self.storage.save('cards/image.jpg', ContentFile(b'other')), name)
+
+    def test_reuse(self):
+        name = self.storage.save('cards/first.jpg', ContentFile(b'image'))
+        self.assertEqual(self.storage.save('cards/second.jpg', ContentFile(b'image')), name)
+        self.assertEqual(len(os.listdir(os.path.join(self.directory, 'cards'))), 1)
+
+    def test_derived_name(self):
+        name = self.storage.save('cards/image.jpg', ContentFile(b'image'))
+        thumbnail = name.replace('.jpg', '_thumb.jpg')
+        self.assertEqual(self.storage.save(thumbnail, ContentFile(b'thumbnail')), thumbnail)
+
+    def serve(self, path, mode):
+        with override_settings(MEDIA_ROOT=self.directory, MEDIA_SERVE_MODE=mode, MEDIA_MAX_AGE=60,
+                               MEDIA_ACCEL_REDIRECT_PREFIX='/protected-media/'):
+            return serve_media(self.factory.get(f'/media/{path}'), path)
+
+    def test_serve_modes(self):
+        name = self.storage.save('cards/image.jpg', ContentFile(b'image'))
+        with open(os.path.join(self.directory, 'plain.txt'), 'wb') as plain_file:
+            plain_file.write(b'text')
+
+        response = self.serve(name, 'django')
+        self.assertEqual(b''.join(response.streaming_content), b'image')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(self.serve('plain.txt', 'django')['Cache-Control'], 'public, max-age=60')
+
+        response = self.serve(name, 'x-accel')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{name}')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+
+        response = self.serve('plain.txt', 'x-sendfile')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.directory, 'plain.txt'))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+
+        with self.assertRaises(ValueError):
+            self.serve(name, 'unknown')
+
+    def test_serve_missing(self):
+        for mode in ('django', 'x-accel', 'x-sendfile'):
+            with self.assertRaises(Http404):
+                self.serve('missing.jpg', mode)
+        # Paths outside MEDIA_ROOT are not handed to web server
+        for mode in ('x-accel', 'x-sendfile'):
+            with self.assertRaises(Http404):
+                self.serve('../secret.txt', mode)
+
+
+class DustTest(ApiTestCase):
+    """Dust balance changes only with DustTransaction records and never goes negative"""
+    def assert_ledger(self):
+        balance = DustTransaction.objects.filter(profile=self.profile).aggregate(Sum('amount'))['amount__sum'] or 0
+        self.assertEqual(self.refresh_profile().dust, balance)
+
+    def test_change_dust(self):
+        self.assertEqual(change_dust(self.profile.id, 30, DUST_REASON_TURN_TO_DUST, self.cards[0].id), 30)
+        self.assertEqual(change_dust(self.profile.id, -20, DUST_REASON_CRAFT, self.cards[1].id), 10)
+        self.assert_ledger()
+        self.assertEqual(DustTransaction.objects.filter(profile=self.profile).count(), 2)
+
+    def test_not_enough_dust(self):
+        change_dust(self.profile.id, 10, DUST_REASON_TURN_TO_DUST)
+        with self.assertRaises(NotEnoughDust):
+            change_dust(self.profile.id, -11, DUST_REASON_CRAFT)
+        self.assertEqual(self.refresh_profile().dust, 10)
+        self.assertEqual(DustTransaction.objects.filter(profile=self.profile).count(), 1)
+        self.assert_ledger()
+
+    def test_rolled_back_with_transaction(self):
+        change_dust(self.profile.id, 10, DUST_REASON_TURN_TO_DUST)
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                change_dust(self.profile.id, -10, DUST_REASON_CRAFT)
+                raise IntegrityError
+        self.assertEqual(self.refresh_profile().dust, 10)
+        self.assert_ledger()
+
+    def test_craft_card(self):
+        card = self.cards[0]
+        response = self.client.post(f'/api/craft_card/{card.id}')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CardEntry.objects.filter(user=self.user).exists())
+        self.assertFalse(DustTransaction.objects.filter(profile=self.profile).exists())
+
+        change_dust(self.profile.id, card.craft_cost, DUST_REASON_TURN_TO_DUST)
+        response = self.client.post(f'/api/craft_card/{card.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['remaining_dust'], 0)
+        self.assertTrue(CardEntry.objects.filter(user=self.user, card=card, source='craft').exists())
+        self.assert_ledger()
+
+    def test_turn_to_dust(self):
+        entries = [self.create_entry(card) for card in self.cards]
+        response = self.client.delete(f'/api/turn_to_dust/{entries[0].id}')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.delete(f'/api/turn_to_dust/{entries[0].id}')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/turn_to_dust_bulk/', {'entries': [entry.id for entry in entries[1:]]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh_profile().dust, sum(card.turn_to_dust_value for card in self.cards))
+        self.assert_ledger()
+
+    def test_rebuild_dust(self):
+        change_dust(self.profile.id, 25, DUST_REASON_TURN_TO_DUST)
+        Profile.objects.filter(id=self.profile.id).update(dust=1000)
+        rebuild_dust([self.profile.id])
+        self.assertEqual(self.refresh_profile().dust, 25)
+
+
+class EligibilityBulkTest(ApiTestCase):
+    """Batch eligibility results are the same as of is_craftable and is_addable"""
+    def test_same_as_single_views(self):
+        other = User.objects.create(username='other')
+        other.profile.cards.add(self.cards[1])
+        self.profile.cards.add(self.cards[0])
+        Card.objects.filter(id=self.cards[2].id).update(craft_cost=100)
+        change_dust(self.profile.id, 50, DUST_REASON_TURN_TO_DUST)
+        entries = [self.create_entry(self.cards[0]), self.create_entry(self.cards[1]),
+                   self.create_entry(self.cards[1], user=other), self.create_entry(self.cards[2], user=other)]
+        card_ids = [card.id for card in self.cards]
+        entry_ids = [entry.id for entry in entries]
+
+        response = self.client.post('/api/eligibility_bulk/', {'cards': card_ids + [0], 'entries': entry_ids + [0]},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        craftable = {card_id: self.client.get(f'/api/is_craftable/{card_id}').json()['result']
+                     for card_id in card_ids}
+        addable = {entry_id: self.client.get(f'/api/is_addable/{entry_id}').json()['result']
+                   for entry_id in entry_ids}
+        self.assertEqual(craftable, {card_ids[0]: 'already_in_collection', card_ids[1]: 'true',
+                                     card_ids[2]: 'not_enough_dust'})
+        self.assertEqual(addable, {entry_ids[0]: 'false', entry_ids[1]: 'true',
+                                   entry_ids[2]: 'false', entry_ids[3]: 'true'})
+        self.assertEqual(data['craftable'], {str(card_id): result for card_id, result in craftable.items()})
+        self.assertEqual(data['addable'], {str(entry_id): result for entry_id, result in addable.items()})
+        self.assertEqual(data['missing_cards'], [0])
+        self.assertEqual(data['missing_entries'], [0])
+        self.assertEqual(self.client.get('/api/is_addable/0').status_code, 400)
+
+    def test_incorrect(self):
+        response = self.client.post('/api/eligibility_bulk/', {'cards': ['1']}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTest(ApiTestCase):
+    """Request metrics measure serializers and are served only with METRICS_TOKEN"""
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+
+    def test_serialize_time(self):
+        response = self.client.get('/api/cards/')
+        self.assertRegex(response['Server-Timing'], r'serialize;dur=[\d.]+, render;dur=[\d.]+')
+        histograms = {name: histogram for (name, route, method), histogram in registry.histograms.items()
+                      if route.startswith('api/cards')}
+        self.assertEqual(histograms['api_request_serialize_seconds'].count, 1)
+        self.assertGreater(histograms['api_request_serialize_seconds'].sum, 0)
+
+    def test_metrics_token(self):
+        client = Client()
+        self.assertEqual(client.get('/metrics/').status_code, 403)
+        with override_settings(METRICS_TOKEN='token', METRICS_ALLOWED_IPS=None):
+            self.assertEqual(client.get('/metrics/').status_code, 403)
+            self.assertEqual(client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(client.get('/metrics/', HTTP_AUTHORIZATION='Bearer токен').status_code, 403)
+            response = client.get('/metrics/', HTTP_AUTHORIZATION='Bearer token')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'api_request_serialize_seconds', response.content)
+        with override_settings(METRICS_TOKEN='token', METRICS_ALLOWED_IPS=['10.0.0.1']):
+            self.assertEqual(client.get('/metrics/', HTTP_AUTHORIZATION='Bearer token').status_code, 403)
+
+
+class ProfilingTest(TestCase):
+    """Profiles are written only for requests with X-Profile header equal to token"""
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def get_response(self, **headers):
+        with override_settings(PROFILING_HEADER_TOKEN='token', PROFILING_SAMPLE_RATE=0, PROFILING_DIR=self.directory):
+            middleware = ProfilingMiddleware(lambda request: HttpResponse())
+        return middleware(RequestFactory().get('/', **headers))
+
+    def test_header_token(self):
+        response = self.get_response(HTTP_X_PROFILE='token')
+        self.assertEqual(os.listdir(self.directory), [response['X-Profile']])
+        for value in ('wrong', 'токен', ''):
+            response = self.get_response(HTTP_X_PROFILE=value)
+            self.assertFalse(response.has_header('X-Profile'), value)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+
+class BenchmarkTest(TestCase):
+    """
+    Query budgets and latency benchmark of every route in api.urls and of
+    async views of api.async_urls on synthetic dataset. Runs on SQLite,
+    results are written to BENCHMARK_OUTPUT as JSON to compare performance
+    across commits.
+    """
+    results = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            ROOT_URLCONF='api.urls', MEDIA_ROOT=cls.media_root,
+            IMAGE_RESIZE_CACHE_DIR=os.path.join(cls.media_root, 'resized'))
+        cls.settings_override.enable()
+        Image.new('RGB', (640, 480), (200, 100, 50)).save(os.path.join(cls.media_root, 'bench.jpg'))
+        cls.results = {'commit': get_commit(),
+                       'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                       'database': connection.vendor,
+                       'iterations': BENCHMARK_ITERATIONS,
+                       'routes': {},
+                       'asgi': {},
+                       'scaling': {}}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        with open(BENCHMARK_OUTPUT, 'w') as output:
+            json.dump(cls.results, output, indent=2)
+
+    @classmethod
+    def setUpTestData(cls):
+        start = time.perf_counter()
+        cls.results['dataset'] = generate_dataset()
+        cls.results['dataset']['seconds'] = time.perf_counter() - start
+
+        user = User.objects.order_by('id').first()
+        DustTransaction.objects.create(profile=user.profile, amount=BENCHMARK_USER_DUST, reason='opening_balance')
+        rebuild_dust([user.profile.id])
+        cls.user_id = user.id
+        cls.authorization = f'Bearer {RefreshToken.for_user(user).access_token}'
+        cls.card_ids = list(Card.objects.order_by('id').values_list('id', flat=True))
+        cls.collection_ids = list(Collection.objects.order_by('id').values_list('id', flat=True))
+        cls.owned_card_ids = list(user.profile.cards.order_by('id').values_list('id', flat=True))
+        cls.entry_ids = list(CardEntry.objects.filter(user=user).order_by('id').values_list('id', flat=True))
+        cls.entry_card_id = CardEntry.objects.get(id=cls.entry_ids[0]).card_id
+
+    def setUp(self):
+        cache.clear()
+        card_pool.invalidate()
+        self.client = Client(HTTP_AUTHORIZATION=self.authorization)
+        owned = set(self.owned_card_ids)
+        self.unowned_card_ids = iter([card_id for card_id in self.card_ids if card_id not in owned])
+        self.n_signups = 0
+
+    def create_entries(self, card_ids):
+        """Returns IDs of new CardEntry objects of benchmark user"""
+        entries = CardEntry.objects.bulk_create(
+            CardEntry(user_id=self.user_id, card_id=card_id, source='pack') for card_id in card_ids)
+        return [entry.id for entry in entries]
+
+    def get_unowned_card_ids(self, count):
+        return [next(self.unowned_card_ids) for _ in range(count)]
+
+    def signup(self):
+        self.n_signups += 1
+        return {'username': f'signup{self.n_signups}', 'password': 'benchmark', 'password2': 'benchmark'}
+
+    def get_route_request(self, route):
+        """
+        Returns (method, path, data) of request to route. Objects consumed
+        by request are created here, so every call makes a fresh request.
+        """
+        card_id = self.card_ids[0]
+        entry_id = self.entry_ids[0]
+        requests = {
+            '^$': lambda: ('get', '/', None),
+            '^cards/$': lambda: ('get', '/cards/', None),
+            '^cards/(?P<id>[^/.]+)/$': lambda: ('get', f'/cards/{card_id}/', None),
+            '^collections/$': lambda: ('get', '/collections/', None),
+            '^collections/(?P<id>[^/.]+)/$': lambda: ('get', f'/collections/{self.collection_ids[0]}/', None),
+            '^my/cards/$': lambda: ('get', '/my/cards/', None),
+            '^my/cards/(?P<id>[^/.]+)/$': lambda: ('get', f'/my/cards/{entry_id}/', None),
+            '^my/inventory/$': lambda: ('get', '/my/inventory/', None),
+            '^my/inventory/(?P<id>[^/.]+)/$': lambda: ('get', f'/my/inventory/{self.entry_card_id}/', None),
+            'signup/': lambda: ('post', '/signup/', self.signup()),
+            'user/': lambda: ('get', '/user/', None),
+            'profile/': lambda: ('get', '/profile/', None),
+            'dashboard/': lambda: ('get', '/dashboard/', None),
+            'add_card_to_collection/<int:entry_id>': lambda: (
+                'post', f'/add_card_to_collection/{self.create_entries(self.get_unowned_card_ids(1))[0]}', None),
+            'add_cards_to_collection_bulk/': lambda: (
+                'post', '/add_cards_to_collection_bulk/',
+                {'entries': self.create_entries(self.get_unowned_card_ids(5))}),
+            'add_card/': lambda: ('post', '/add_card/?source=pack', None),
+            'add_card_admin/': lambda: ('post', '/add_card_admin/?source=pack', None),
+            'open_pack/': lambda: ('post', '/open_pack/?source=pack&count=10', None),
+            'craft_card/<int:card_id>': lambda: ('post', f'/craft_card/{self.get_unowned_card_ids(1)[0]}', None),
+            'turn_to_dust/<int:entry_id>': lambda: (
+                'delete', f'/turn_to_dust/{self.create_entries([card_id])[0]}', None),
+            'turn_to_dust_bulk/': lambda: (
+                'post', '/turn_to_dust_bulk/', {'entries': self.create_entries(self.card_ids[:10])}),
+            'cards_bulk/': lambda: ('post', '/cards_bulk/', {'cards': self.card_ids[:100]}),
+            'collection_progress/<int:collection_id>': lambda: (
+                'get', f'/collection_progress/{self.collection_ids[0]}', None),
+            'get_user_statistics/': lambda: ('get', '/get_user_statistics/', None),
+            'is_addable/<int:entry_id>': lambda: ('get', f'/is_addable/{entry_id}', None),
+            'is_daily_card_available/': lambda: ('get', '/is_daily_card_available/', None),
+            'is_craftable/<int:card_id>': lambda: ('get', f'/is_craftable/{card_id}', None),
+            'eligibility_bulk/': lambda: (
+                'post', '/eligibility_bulk/', {'cards': self.card_ids[:50], 'entries': self.entry_ids}),
+            'images/<path:name>': lambda: ('get', '/images/bench.jpg?w=240', None),
+        }
+        return requests[route]()
+
+    def send(self, method, path, data=None):
+        """Sends request and reads whole response, also streaming one"""
+        response = getattr(self.client, method)(path, data, content_type='application/json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def count_queries(self, method, path, data=None):
+        """Returns response and number of queries with empty cache"""
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send(method, path, data)
+        self.assertLess(response.status_code, 400, f'{method.upper()} {path}: {response.status_code}')
+        return response, len(queries)
+
+    def test_routes_covered(self):
+        """Every route of api.urls has a query budget and a benchmark request"""
+        routes = get_api_routes()
+        self.assertEqual(sorted(routes), sorted(QUERY_BUDGETS))
+        for route in routes:
+            _, path, _ = self.get_route_request(route)
+            self.assertEqual(resolve(path.split('?')[0]).route, route)
+
+    def test_query_budgets(self):
+        for route in get_api_routes():
+            method, path, data = self.get_route_request(route)
+            _, n_queries = self.count_queries(method, path, data)
+            with self.subTest(route=route):
+                self.assertLessEqual(n_queries, QUERY_BUDGETS[route])
+
+    def assert_constant_queries(self, name, sizes, get_request):
+        """Checks that number of queries does not depend on request size"""
+        counts = {}
+        for size in sizes:
+            _, counts[size] = self.count_queries(*get_request(size))
+        self.results['scaling'][name] = counts
+        self.assertEqual(len(set(counts.values())), 1, f'{name}: {counts}')
+
+    def test_cards_bulk_queries_constant(self):
+        # Cards are fetched with one query per chunk
+        self.assert_constant_queries('cards_bulk', [1, 10, CardsBulkView.chunk_size], lambda size: (
+            'post', '/cards_bulk/', {'cards': self.card_ids[:size]}))
+        self.assert_constant_queries('cards_bulk_rarity', [1, 10, CardsBulkView.chunk_size], lambda size: (
+            'post', '/cards_bulk/', {'cards': self.card_ids[:size], 'ordering': 'rarity'}))
+
+    def test_eligibility_bulk_queries_constant(self):
+        self.assert_constant_queries('eligibility_bulk', [1, 10, 200], lambda size: (
+            'post', '/eligibility_bulk/', {'cards': self.card_ids[:size],
+                                           'entries': self.create_entries(self.card_ids[:size])}))
+
+    def test_turn_to_dust_bulk_queries_constant(self):
+        self.assert_constant_queries('turn_to_dust_bulk', [1, 10, 200], lambda size: (
+            'post', '/turn_to_dust_bulk/', {'entries': self.create_entries(self.card_ids[:size])}))
+
+    def test_add_cards_to_collection_bulk_queries_constant(self):
+        # Cards of one collection, progress is updated once per collection
+        collection = Collection.objects.get(id=self.collection_ids[-1])
+        owned = set(self.owned_card_ids)
+        card_ids = iter(card_id for card_id in collection.cards.order_by('id').values_list('id', flat=True)
+                        if card_id not in owned)
+        self.assert_constant_queries('add_cards_to_collection_bulk', [1, 5], lambda size: (
+            'post', '/add_cards_to_collection_bulk/',
+            {'entries': self.create_entries([next(card_ids) for _ in range(size)])}))
+
+    def test_list_queries_constant(self):
+        for path in ('/cards/', '/collections/', '/collections/?expand=cards', '/my/cards/', '/my/inventory/'):
+            separator = '&' if '?' in path else '?'
+            self.assert_constant_queries(f'list {path}', [1, 10, 50], lambda size: (
+                'get', f'{path}{separator}page_size={size}', None))
+
+    def test_latency(self):
+        for route in get_api_routes():
+            method, path, data = self.get_route_request(route)
+            response, n_queries = self.count_queries(method, path, data)
+            times = []
+            for _ in range(BENCHMARK_ITERATIONS):
+                method, path, data = self.get_route_request(route)
+                start = time.perf_counter()
+                response = self.send(method, path, data)
+                times.append(time.perf_counter() - start)
+                self.assertLess(response.status_code, 400, f'{method.upper()} {path}: {response.status_code}')
+            self.results['routes'][route] = {'method': method.upper(),
+                                             'path': path,
+                                             'queries': n_queries,
+                                             'budget': QUERY_BUDGETS[route],
+                                             'mean_ms': statistics.mean(times) * 1000,
+                                             'max_ms': max(times) * 1000,
+                                             **get_percentiles(times)}
+
+    def get_state(self):
+        """Returns fields of benchmark user Profile maintained by signals and views"""
+        profile = Profile.objects.get(user_id=self.user_id)
+        progress = (CollectionProgress.objects
+                    .filter(profile=profile, owned_count__gt=0)
+                    .order_by('collection_id')
+                    .values_list('collection_id', 'owned_count'))
+        return {'owned_cards': bytes(profile.owned_cards), 'n_cards': profile.n_cards,
+                'n_collections': profile.n_collections, 'dust': profile.dust, 'progress': list(progress)}
+
+    def test_write_routes(self):
+        profile_id = Profile.objects.get(user_id=self.user_id).id
+        state = self.get_state()
+
+        card_id = self.get_unowned_card_ids(1)[0]
+        entry_id = self.create_entries([card_id])[0]
+        response = self.send('post', f'/add_card_to_collection/{entry_id}')
+        self.assertEqual(response.json()['card']['id'], card_id)
+        self.assertFalse(CardEntry.objects.filter(id=entry_id).exists())
+
+        card_ids = self.get_unowned_card_ids(5)
+        response = self.send('post', '/add_cards_to_collection_bulk/', {'entries': self.create_entries(card_ids)})
+        self.assertEqual([card['id'] for card in response.json()['cards']], card_ids)
+        profile = Profile.objects.get(id=profile_id)
+        self.assertTrue(all(owns_card(profile, card_id) for card_id in card_ids))
+        self.assertEqual(profile.n_cards, state['n_cards'] + 6)
+
+        card = Card.objects.get(id=self.get_unowned_card_ids(1)[0])
+        response = self.send('post', f'/craft_card/{card.id}')
+        self.assertEqual(response.json()['remaining_dust'], state['dust'] - card.craft_cost)
+
+        entry_ids = self.create_entries(self.card_ids[:10])
+        dust = sum(Card.objects.filter(id__in=self.card_ids[:10]).values_list('turn_to_dust_value', flat=True))
+        response = self.send('post', '/turn_to_dust_bulk/', {'entries': entry_ids})
+        self.assertEqual(response.json()['remaining_dust'], state['dust'] - card.craft_cost + dust)
+
+        response = self.send('get', '/get_user_statistics/')
+        self.assertEqual(response.json(), {'n_user_cards': profile.n_cards,
+                                           'n_user_collections': profile.n_collections,
+                                           'n_cards': Card.objects.count(),
+                                           'n_collections': Collection.objects.count()})
+
+    def test_maintained_state(self):
+        """Fields maintained on every route equal fields recalculated from scratch"""
+        for route in get_api_routes():
+            self.send(*self.get_route_request(route))
+        profile_id = Profile.objects.get(user_id=self.user_id).id
+        state = self.get_state()
+        rebuild_owned_cards([profile_id])
+        rebuild_profile_counters([profile_id])
+        rebuild_collection_progress(profile_ids=[profile_id])
+        rebuild_dust([profile_id])
+        self.assertEqual(self.get_state(), state)
+
+    @override_settings(ROOT_URLCONF='api.async_urls')
+    async def test_async_latency(self):
+        """Views of api.async_urls answer like api.urls, their latency is recorded under 'asgi'"""
+        client = AsyncClient()
+        paths = ['/cards/', f'/cards/{self.card_ids[0]}/', '/collections/', f'/collections/{self.collection_ids[0]}/',
+                 '/dashboard/', f'/collection_progress/{self.collection_ids[0]}', '/get_user_statistics/',
+                 '/is_daily_card_available/']
+        for path in paths:
+            with override_settings(ROOT_URLCONF='api.urls'):
+                expected = await sync_to_async(self.send)('get', path)
+            times = []
+            for _ in range(BENCHMARK_ITERATIONS):
+                start = time.perf_counter()
+                # AsyncClient takes headers by name, not as WSGI environ keys
+                response = await client.get(path, authorization=self.authorization)
+                times.append(time.perf_counter() - start)
+                self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(json.loads(response.content), json.loads(expected.content), path)
+            self.results['asgi'][path] = {'mean_ms': statistics.mean(times) * 1000,
+                                          'max_ms': max(times) * 1000,
+                                          **get_percentiles(times)}
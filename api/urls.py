@@ -1,31 +1,39 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import (SignUpView, UserView, ProfileView, AddCardToCollectionView,
-                    AddCardView, AddCardAdminView, CraftCardView, TurnCardIntoDustView,
-                    CardsBulkView, CollectionProgressView, GetUserStatisticsView,
-                    IsAddableToCollectionView, IsDailyCardAvailableView, IsCraftableView)
-from .views import CardViewSet, CollectionViewSet, MyCardsViewSet
+from .views import (SignUpView, UserView, ProfileView, DashboardView, AddCardToCollectionView,
+                    AddCardsToCollectionBulkView, AddCardView, AddCardAdminView, OpenPackView, CraftCardView, TurnCardIntoDustView,
+                    TurnCardsIntoDustBulkView, CardsBulkView, CollectionProgressView, GetUserStatisticsView,
+                    IsAddableToCollectionView, IsDailyCardAvailableView, IsCraftableView,
+                    EligibilityBulkView, ResizeImageView)
+from .views import CardViewSet, CollectionViewSet, MyCardsViewSet, InventoryViewSet
 
 # Default router for ViewSets
 router = DefaultRouter()
 router.register('cards', CardViewSet, basename='cards')
 router.register('collections', CollectionViewSet, basename='collections')
 router.register('my/cards', MyCardsViewSet, basename='my_cards')
+router.register('my/inventory', InventoryViewSet, basename='my_inventory')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('signup/', SignUpView.as_view()),
     path('user/', UserView.as_view()),
     path('profile/', ProfileView.as_view()),
+    path('dashboard/', DashboardView.as_view()),
     path('add_card_to_collection/<int:entry_id>', AddCardToCollectionView.as_view()),
+    path('add_cards_to_collection_bulk/', AddCardsToCollectionBulkView.as_view()),
     path('add_card/', AddCardView.as_view()),
     path('add_card_admin/', AddCardAdminView.as_view()),
+    path('open_pack/', OpenPackView.as_view()),
     path('craft_card/<int:card_id>', CraftCardView.as_view()),
     path('turn_to_dust/<int:entry_id>', TurnCardIntoDustView.as_view()),
+    path('turn_to_dust_bulk/', TurnCardsIntoDustBulkView.as_view()),
     path('cards_bulk/', CardsBulkView.as_view()),
     path('collection_progress/<int:collection_id>', CollectionProgressView.as_view()),
     path('get_user_statistics/', GetUserStatisticsView.as_view()),
     path('is_addable/<int:entry_id>', IsAddableToCollectionView.as_view()),
     path('is_daily_card_available/', IsDailyCardAvailableView.as_view()),
     path('is_craftable/<int:card_id>', IsCraftableView.as_view()),
+    path('eligibility_bulk/', EligibilityBulkView.as_view()),
+    path('images/<path:name>', ResizeImageView.as_view()),
 ]
@@ -1,22 +1,41 @@
-import random
 import datetime
+import heapq
+import os
+from collections import Counter
+
 import pytz
 
 from rest_framework import viewsets
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework import permissions
-from rest_framework import pagination
 from rest_framework import generics
 from rest_framework.views import APIView
-from rest_framework import filters
 from rest_framework import serializers
 from django.core.mail import send_mail
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, IntegerField, Max, Min, OuterRef, Prefetch, When
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from PIL import UnidentifiedImageError
 from django.conf import settings
 
 from .serializers import (SignUpSerializer, UserSerializer, ProfileSerializer,
-                          CardSerializer, CollectionSerializer, CardEntrySerializer)
-from .models import Card, Collection, CardEntry
+                          CardSerializer, CollectionSerializer, CardEntrySerializer,
+                          InventoryCardSerializer)
+from .models import Card, Collection, CardEntry, DailyClaim, Profile
+from .card_pool import card_pool
+from .progress import get_completed_collection_ids, get_owned_count
+from .ownership import owns_card
+from .dust import (DUST_REASON_CRAFT, DUST_REASON_TURN_TO_DUST, EntriesChanged, NotEnoughDust,
+                   change_dust, turn_entries_into_dust)
+from .search import FullTextSearchFilter
+from .pagination import KeysetPagination
+from .aggregates import ConcatIds
+from .catalog_cache import CatalogCacheMixin, get_catalog_counts
+from .sparse import EXPAND_QUERY_PARAM, SparseFieldsViewMixin, parse_field_names
+from .resize import RESIZE_FORMATS, get_resize_cache
 
 # Static variables with error description
 MESSAGE_USER_CREATED_SUCCESS = 'Успех. Пользователь создан.'
@@ -25,14 +44,80 @@ MESSAGE_TURN_TO_DUST_SUCCESS = 'Успех. Карточка превращен
 
 ERROR_ADD_CARD_SOURCE_REQUIRED = 'Ошибка. Укажите источник получения карточки.'
 ERROR_ADD_CARD_DAILY_REFUSED = 'Ошибка. Отказано в получении ежедневной карточки.'
+ERROR_OPEN_PACK_COUNT_INCORRECT = 'Ошибка. Количество карточек в наборе должно быть от 5 до 50.'
+ERROR_OPEN_PACK_DAILY_REFUSED = 'Ошибка. Набор не может быть получен как ежедневная карточка.'
 ERROR_ADD_CARD_TO_COLLECTION_DUPLICATE = 'Ошибка. Карточка с таким ID уже находится в коллекции.'
 ERROR_CRAFT_CARD_NOT_ENOUGH_DUST = 'Ошибка. Недостаточно пыли для создания карточки.'
 ERROR_CRAFT_CARD_ALREADY_IN_COLLECTION = 'Ошибка. Карточка с таким ID уже находится в коллекции'
 ERROR_CARD_ENTRY_DOES_NOT_EXIST = 'Ошибка. Записи с указанным ID не существует.'
 ERROR_CARD_DOES_NOT_EXIST = 'Ошибка. Карточки с указанным ID не существует.'
+ERROR_CARDS_BULK_INCORRECT = 'Ошибка. Список карточек должен содержать ID карточек.'
+ERROR_IMAGE_SIZE_INCORRECT = 'Ошибка. Недопустимый размер или формат изображения.'
+ERROR_IMAGE_DOES_NOT_EXIST = 'Ошибка. Изображения с указанным именем не существует.'
 ERROR_CARD_ENTRY_USER_INCORRECT = 'Ошибка. Неверно указано имя пользователя.'
+ERROR_CARD_ENTRIES_INCORRECT = 'Ошибка. Список записей должен содержать ID записей.'
+ERROR_ELIGIBILITY_BULK_INCORRECT = 'Ошибка. Списки карточек и записей должны содержать ID.'
+ERROR_TURN_TO_DUST_BULK_INCORRECT = 'Ошибка. Укажите список ID записей или дубликаты.'
+ERROR_CARD_ENTRIES_CHANGED = 'Ошибка. Записи были изменены, повторите запрос.'
+
+
+def get_daily_claim_day():
+    """Returns current day (UTC) for daily Card claims"""
+    return datetime.datetime.now(pytz.utc).date()
+
+
+def is_daily_card_available(user):
+    """Returns 'true' if User has not claimed daily Card today, else 'false'"""
+    claimed = DailyClaim.objects.filter(user=user, day=get_daily_claim_day()).exists()
+    return 'false' if claimed else 'true'
+
+
+def get_dashboard(user, context):
+    """Returns dashboard data of User, see DashboardView"""
+    daily_claim = DailyClaim.objects.filter(user=OuterRef('user'), day=get_daily_claim_day())
+    profile = (Profile.objects
+               .annotate(daily_claimed=Exists(daily_claim))
+               .get(user=user))
+
+    return {'user': UserSerializer(user, context=context).data,
+            'profile': ProfileSerializer(profile, context=context).data,
+            'statistics': get_user_statistics(profile),
+            'is_daily_card_available': 'false' if profile.daily_claimed else 'true'}
+
+
+def get_user_statistics(profile):
+    """Returns User statistics from Profile counters and cached catalog counts"""
+    catalog_counts = get_catalog_counts()
+    return {'n_user_cards': profile.n_cards,
+            'n_user_collections': profile.n_collections,
+            'n_cards': catalog_counts['n_cards'],
+            'n_collections': catalog_counts['n_collections']}
+
+
+def get_collection_progress(profile, collection_id):
+    """Returns IDs of acquired and not acquired Collection cards and owned count"""
+    collection = Collection.objects.get(id=collection_id)
+
+    acquired = []
+    not_acquired = []
+    for card_id in collection.cards.values_list('id', flat=True):
+        if owns_card(profile, card_id):
+            acquired.append(card_id)
+        else:
+            not_acquired.append(card_id)
+
+    return {'acquired': acquired,
+            'not_acquired': not_acquired,
+            'owned_count': get_owned_count(profile, collection)}
 
-random.seed()
+
+def get_craftable_result(profile, card_id, craft_cost):
+    """Returns result of craftable check of Card for Profile"""
+    if owns_card(profile, card_id):
+        return 'already_in_collection'
+    if profile.dust < craft_cost:
+        return 'not_enough_dust'
+    return 'true'
 
 
 class SignUpView(generics.GenericAPIView):
@@ -69,51 +154,105 @@ class ProfileView(generics.GenericAPIView):
         return Response(message)
 
 
-class CardPagination(pagination.PageNumberPagination):
+class DashboardView(generics.GenericAPIView):
+    """
+    View for data needed on app start: User, Profile, User statistics and
+    daily Card availability in one response. Profile is fetched together
+    with daily claim check, statistics come from Profile counters and
+    cached Card and Collection counts.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        message = get_dashboard(request.user, self.get_serializer_context())
+        return Response(message)
+
+
+class CardPagination(KeysetPagination):
     """Pagination class for Card list"""
     page_size = 18
     page_size_query_param = 'page_size'
+    keyset_ordering = ('id',)
 
 
-class CardViewSet(viewsets.ModelViewSet):
-    """ViewSet for Cards. Lookup field is 'id'."""
+class CardViewSet(CatalogCacheMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for Cards. Lookup field is 'id'. Responses are cached by catalog version.
+    Fields may be selected with ?fields= and ?omit=, list leaves out long_description.
+    """
     search_fields = ['name', 'short_description', 'long_description']
-    filter_backends = (filters.SearchFilter,)
+    filter_backends = (FullTextSearchFilter,)
     serializer_class = CardSerializer
-    queryset = Card.objects.all()
+    queryset = Card.objects.order_by('id')
     lookup_field = 'id'
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CardPagination
 
 
-class CollectionPagination(pagination.PageNumberPagination):
+class CollectionPagination(KeysetPagination):
     """Pagination class for Collection list"""
     page_size = 10
     page_size_query_param = 'page_size'
-    ordering = 'created'
+    keyset_ordering = ('created', 'id')
 
 
-class CollectionViewSet(viewsets.ModelViewSet):
-    """ViewSet for Collections. Lookup field is 'id'."""
-    search_fields = ['name', 'description']
-    filter_backends = (filters.SearchFilter,)
+class CollectionViewSet(CatalogCacheMixin, SparseFieldsViewMixin, viewsets.ModelViewSet):
+    """
+    ViewSet for Collections. Lookup field is 'id'. Responses are cached by catalog version.
+    Fields may be selected with ?fields= and ?omit=, list leaves out long_description.
+    With ?expand=cards cards are embedded with 'owned' flag of User and
+    collection has 'progress'. Cards of all collections are fetched with
+    one prefetch query, ownership is checked with EXISTS subquery. Such
+    responses depend on User, so they are not cached. Without expand only
+    Card IDs are prefetched.
+    """
+    search_fields = ['name', 'short_description', 'long_description']
+    filter_backends = (FullTextSearchFilter,)
     serializer_class = CollectionSerializer
-    queryset = Collection.objects.all()
+    queryset = Collection.objects.order_by('created', 'id')
     lookup_field = 'id'
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = CollectionPagination
 
+    def get_expand(self):
+        return parse_field_names(self.request, EXPAND_QUERY_PARAM) or set()
+
+    def is_catalog_cacheable(self, request):
+        return 'cards' not in self.get_expand()
 
-class MyCardsPagination(pagination.PageNumberPagination):
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand'] = self.get_expand()
+        return context
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if 'cards' in self.get_expand() and self.action in ('list', 'retrieve'):
+            owned = Profile.cards.through.objects.filter(profile_id=self.request.user.profile.id,
+                                                         card_id=OuterRef('id'))
+            cards = (Card.objects
+                     .annotate(owned=Exists(owned))
+                     .defer('long_description', 'search_vector')
+                     .order_by('id'))
+            queryset = queryset.prefetch_related(Prefetch('cards', queryset=cards))
+        elif self.action in ('list', 'retrieve'):
+            # Card IDs of all collections with one query
+            queryset = queryset.prefetch_related(Prefetch('cards', queryset=Card.objects.only('id')))
+        return queryset
+
+
+class MyCardsPagination(KeysetPagination):
     """Pagination class for MyCards list"""
     page_size = 18
     page_size_query_param = 'page_size'
+    keyset_ordering = ('card__name', 'id')
 
 
 class MyCardsViewSet(viewsets.ModelViewSet):
     """ViewSet for MyCards. Lookup field is 'id'."""
-    search_fields = ['name', 'short_description', 'long_description']
-    filter_backends = (filters.SearchFilter,)
+    search_fields = ['card__name', 'card__short_description', 'card__long_description']
+    search_relation = 'card'
+    filter_backends = (FullTextSearchFilter,)
     serializer_class = CardEntrySerializer
     lookup_field = 'id'
     permission_classes = [permissions.IsAuthenticated]
@@ -121,7 +260,43 @@ class MyCardsViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        queryset = CardEntry.objects.filter(user=user).order_by('card__name')
+        queryset = CardEntry.objects.filter(user=user).order_by('card__name', 'id')
+        return queryset
+
+
+class InventoryPagination(KeysetPagination):
+    """Pagination class for Inventory list"""
+    page_size = 18
+    page_size_query_param = 'page_size'
+    keyset_ordering = ('name', 'id')
+
+
+class InventoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for User's inventory. Lookup field is Card 'id'.
+    CardEntry objects of User are grouped by Card in SQL, every Card goes
+    with number of entries, first and last acquired time and entry IDs.
+    Cards in list are lightweight, so rich text is not fetched.
+    """
+    search_fields = ['name', 'short_description', 'long_description']
+    filter_backends = (FullTextSearchFilter,)
+    serializer_class = InventoryCardSerializer
+    lookup_field = 'id'
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = InventoryPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = (Card.objects
+                    .filter(cardentry__user=user)
+                    .annotate(entry_count=Count('cardentry'),
+                              first_acquired=Min('cardentry__acquired'),
+                              last_acquired=Max('cardentry__acquired'),
+                              entry_ids=ConcatIds('cardentry__id'))
+                    .defer('search_vector')
+                    .order_by('name', 'id'))
+        if self.action == 'list':
+            queryset = queryset.defer('long_description')
         return queryset
 
 
@@ -131,14 +306,14 @@ class AddCardToCollectionView(generics.GenericAPIView):
     Checks if CardEntry exists, if user in request is the same user in
     CardEntry and if Card is not already in a collection. If everything
     is ok, adds card to a collection, checks if collection is completed
-    and adds it to collection list if completed.
+    and adds it to collection list if completed, in one transaction.
     """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CardSerializer
 
     def post(self, request, *args,  **kwargs):
         try:
-            card_entry = CardEntry.objects.get(id=self.kwargs['entry_id'])
+            card_entry = CardEntry.objects.select_related('card', 'user__profile').get(id=self.kwargs['entry_id'])
         except CardEntry.DoesNotExist:
             message = {'error': ERROR_CARD_ENTRY_DOES_NOT_EXIST}
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
@@ -149,30 +324,78 @@ class AddCardToCollectionView(generics.GenericAPIView):
             return Response(message, status=status.HTTP_403_FORBIDDEN)
 
         card = card_entry.card
-        cards_list = list(user.profile.cards.all().values())
-        cards_list = [c['id'] for c in cards_list]
-
-        if card.id in cards_list:
+        profile = user.profile
+        if owns_card(profile, card.id):
             message = {'error': ERROR_ADD_CARD_TO_COLLECTION_DUPLICATE}
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
-        user.profile.cards.add(card)
-        collection = card.related_collection
-        collection_cards = list(collection.cards.values_list('id', flat=True))
-        user_profile_cards = list(user.profile.cards.values_list('id', flat=True))
+        with transaction.atomic():
+            profile.cards.add(card)
+            collection_id = card.related_collection_id
+            if collection_id is not None and get_completed_collection_ids(profile, [collection_id]):
+                profile.collections.add(collection_id)
+            card_entry.delete()
 
-        completed = True
-        for collection_card in collection_cards:
-            if collection_card not in user_profile_cards:
-                completed = False
-                break
-        if completed:
-            user.profile.collections.add(collection)
+        message = {'card': CardSerializer(card, context=self.get_serializer_context()).data,
+                   'message': MESSAGE_ADD_CARD_TO_COLLECTION_SUCCESS}
+        return Response(message)
 
-        user.profile.save()
-        card_entry.delete()
 
-        message = {'card': CardSerializer(card, context=self.get_serializer_context()).data,
+class AddCardsToCollectionBulkView(generics.GenericAPIView):
+    """
+    View for adding many cards to User's collection at once.
+    Takes list of CardEntry IDs in 'entries'. Entries are checked with one
+    query, new cards are added with one bulk insert, completion is checked
+    once per affected collection and consumed entries are deleted with one
+    DELETE. Entries of cards already in collection (or repeated in the
+    list) are not consumed and are returned in 'skipped'.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = CardSerializer
+
+    def post(self, request, *args, **kwargs):
+        entry_list = request.data.get('entries', None)
+        if (not isinstance(entry_list, list) or not entry_list
+                or not all(isinstance(entry_id, int) for entry_id in entry_list)):
+            message = {'error': ERROR_CARD_ENTRIES_INCORRECT}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        entry_ids = list(dict.fromkeys(entry_list))
+        entries = CardEntry.objects.filter(id__in=entry_ids).in_bulk(field_name='id')
+        if len(entries) != len(entry_ids):
+            message = {'error': ERROR_CARD_ENTRY_DOES_NOT_EXIST}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+        if any(entry.user_id != request.user.id for entry in entries.values()):
+            message = {'error': ERROR_CARD_ENTRY_USER_INCORRECT}
+            return Response(message, status=status.HTTP_403_FORBIDDEN)
+
+        profile = request.user.profile
+        consumed = {}
+        skipped = []
+        for entry_id in entry_ids:
+            card_id = entries[entry_id].card_id
+            if card_id in consumed or owns_card(profile, card_id):
+                skipped.append(entry_id)
+            else:
+                consumed[card_id] = entry_id
+
+        try:
+            with transaction.atomic():
+                cards = list(Card.objects.filter(id__in=consumed).order_by('id'))
+                profile.cards.add(*cards)
+                collection_ids = {card.related_collection_id for card in cards} - {None}
+                completed = get_completed_collection_ids(profile, collection_ids)
+                profile.collections.add(*completed)
+                deleted, _ = CardEntry.objects.filter(id__in=consumed.values()).delete()
+                if deleted != len(consumed):
+                    raise EntriesChanged
+        except EntriesChanged:
+            message = {'error': ERROR_CARD_ENTRIES_CHANGED}
+            return Response(message, status=status.HTTP_409_CONFLICT)
+
+        message = {'cards': CardSerializer(cards, many=True, context=self.get_serializer_context()).data,
+                   'skipped': skipped,
+                   'completed_collections': completed,
                    'message': MESSAGE_ADD_CARD_TO_COLLECTION_SUCCESS}
         return Response(message)
 
@@ -180,8 +403,9 @@ class AddCardToCollectionView(generics.GenericAPIView):
 class AddCardView(generics.GenericAPIView):
     """
     Adds card to a User card list.
-    If source is daily Card, then checks the data when last card was
-    acquired. Randomize the card that User will receive and adds CardEntry.
+    If source is daily Card, then records DailyClaim for today, unique
+    constraint refuses the second claim. Randomize the card that User will
+    receive and adds CardEntry.
     """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CardEntrySerializer
@@ -192,33 +416,21 @@ class AddCardView(generics.GenericAPIView):
             message = {'error': ERROR_ADD_CARD_SOURCE_REQUIRED}
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
-        if source == 'daily':
-            last_daily = CardEntry.objects.filter(user=request.user).filter(source='daily').last()
-            if last_daily is None:
-                last_date = datetime.date(year=2000, month=1, day=1)
-            else:
-                last_date = last_daily.acquired
-                
-            today = datetime.datetime.now(pytz.utc)
-            if today.date() == last_date.date():
-                message = {'error': ERROR_ADD_CARD_DAILY_REFUSED}
-                return Response(message, status=status.HTTP_400_BAD_REQUEST)
-
-        chance = random.randint(1, 100)
-        if chance <= 70:
-            rarity = 'common'
-        elif 70 < chance <= 90:
-            rarity = 'rare'
-        elif 90 < chance <= 100:
-            rarity = 'epic'
-
-        cards = list(Card.objects.filter(rarity=rarity).all())
-        random_card = random.choice(cards)
         card_entry = CardEntry()
-        card_entry.card = random_card
+        card_entry.card_id = card_pool.draw_random()
         card_entry.user = request.user
         card_entry.source = source
-        card_entry.save()
+
+        with transaction.atomic():
+            if source == 'daily':
+                # Only the unique (user, day) constraint means the claim is refused
+                try:
+                    with transaction.atomic():
+                        DailyClaim.objects.create(user=request.user, day=get_daily_claim_day())
+                except IntegrityError:
+                    message = {'error': ERROR_ADD_CARD_DAILY_REFUSED}
+                    return Response(message, status=status.HTTP_400_BAD_REQUEST)
+            card_entry.save()
 
         message = {'card': CardEntrySerializer(card_entry, context=self.get_serializer_context()).data}
         return Response(message)
@@ -239,18 +451,8 @@ class AddCardAdminView(generics.GenericAPIView):
             message = {'error': ERROR_ADD_CARD_SOURCE_REQUIRED}
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
-        chance = random.randint(1, 100)
-        if chance <= 70:
-            rarity = 'common'
-        elif 70 < chance <= 90:
-            rarity = 'rare'
-        elif 90 < chance <= 100:
-            rarity = 'epic'
-
-        cards = list(Card.objects.filter(rarity=rarity).all())
-        random_card = random.choice(cards)
         card_entry = CardEntry()
-        card_entry.card = random_card
+        card_entry.card_id = card_pool.draw_random()
         card_entry.user = request.user
         card_entry.source = source
         card_entry.save()
@@ -259,10 +461,49 @@ class AddCardAdminView(generics.GenericAPIView):
         return Response(message)
 
 
+class OpenPackView(generics.GenericAPIView):
+    """
+    Adds pack of cards to a User card list.
+    Rolls rarities for all cards in one batch and creates all CardEntry
+    objects with a single bulk insert.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = CardEntrySerializer
+    min_count = 5
+    max_count = 50
+
+    def post(self, request, *args,  **kwargs):
+        source = request.GET.get('source', None)
+        if source is None:
+            message = {'error': ERROR_ADD_CARD_SOURCE_REQUIRED}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        if source == 'daily':
+            message = {'error': ERROR_OPEN_PACK_DAILY_REFUSED}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            count = int(request.GET.get('count', self.min_count))
+        except ValueError:
+            count = 0
+        if not self.min_count <= count <= self.max_count:
+            message = {'error': ERROR_OPEN_PACK_COUNT_INCORRECT}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        card_entries = [CardEntry(card_id=card_id, user=request.user, source=source)
+                        for card_id in card_pool.draw_many(count)]
+        with transaction.atomic():
+            card_entries = CardEntry.objects.bulk_create(card_entries)
+
+        message = {'cards': CardEntrySerializer(card_entries, many=True,
+                                                context=self.get_serializer_context()).data}
+        return Response(message)
+
+
 class CraftCardView(generics.GenericAPIView):
     """
     View for crafting cards.
-    Checks if User has enough dust and adds CardEntry.
+    Spends dust with conditional UPDATE and adds CardEntry in one transaction.
     """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CardEntrySerializer
@@ -272,22 +513,22 @@ class CraftCardView(generics.GenericAPIView):
         card = Card.objects.get(id=card_id)
         profile = request.user.profile
 
-        if profile.dust < card.craft_cost:
-            message = {'error': ERROR_CRAFT_CARD_NOT_ENOUGH_DUST}
-            return Response(message, status=status.HTTP_400_BAD_REQUEST)
-
-        if card in profile.cards.all():
+        if owns_card(profile, card.id):
             message = {'error': ERROR_CRAFT_CARD_ALREADY_IN_COLLECTION}
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
-        profile.dust -= card.craft_cost
-        profile.save()
-        
         card_entry = CardEntry()
         card_entry.card = card
         card_entry.user = request.user
         card_entry.source = 'craft'
-        card_entry.save()
+
+        try:
+            with transaction.atomic():
+                profile.dust = change_dust(profile.id, -card.craft_cost, DUST_REASON_CRAFT, card.id)
+                card_entry.save()
+        except NotEnoughDust:
+            message = {'error': ERROR_CRAFT_CARD_NOT_ENOUGH_DUST}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
         message = {'card': CardEntrySerializer(card_entry, context=self.get_serializer_context()).data,
                    'remaining_dust': profile.dust}
@@ -295,104 +536,184 @@ class CraftCardView(generics.GenericAPIView):
 
 
 class TurnCardIntoDustView(generics.GenericAPIView):
-    """View for turning card into a dust. Adds dust to a profile."""
+    """
+    View for turning card into a dust. Adds dust to a profile.
+    CardEntry is deleted and dust is added in one transaction, so entry
+    can not be turned into dust twice by concurrent requests.
+    """
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = CardSerializer
 
     def delete(self, request, *args,  **kwargs):
         try:
-            card_entry = CardEntry.objects.get(id=self.kwargs['entry_id'])
+            card_entry = CardEntry.objects.select_related('card').get(id=self.kwargs['entry_id'])
         except CardEntry.DoesNotExist:
             message = {'error': ERROR_CARD_ENTRY_DOES_NOT_EXIST}
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
-        
-        user = card_entry.user
-        if user != request.user:
+
+        if card_entry.user_id != request.user.id:
             message = {'error': ERROR_CARD_ENTRY_USER_INCORRECT}
             return Response(message, status=status.HTTP_403_FORBIDDEN)
 
         card = card_entry.card
-        user.profile.dust += card.turn_to_dust_value
-        user.profile.save()
-        card_entry.delete()
+        with transaction.atomic():
+            deleted, _ = CardEntry.objects.filter(id=card_entry.id).delete()
+            if deleted:
+                request.user.profile.dust = change_dust(request.user.profile.id, card.turn_to_dust_value,
+                                                        DUST_REASON_TURN_TO_DUST, card.id)
+        if not deleted:
+            message = {'error': ERROR_CARD_ENTRY_DOES_NOT_EXIST}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
         message = {'card': CardSerializer(card, context=self.get_serializer_context()).data,
                    'message': MESSAGE_TURN_TO_DUST_SUCCESS}
         return Response(message)
 
 
+class TurnCardsIntoDustBulkView(generics.GenericAPIView):
+    """
+    View for turning many cards into a dust at once.
+    Takes list of CardEntry IDs in 'entries' or 'duplicates': true for all
+    User's entries of cards already in collection. Entries are deleted and
+    dust is added in one transaction with set-based queries.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        entry_list = request.data.get('entries', None)
+        duplicates = request.data.get('duplicates', False)
+        profile = request.user.profile
+        entries = CardEntry.objects.filter(user=request.user)
+
+        if duplicates is True and entry_list is None:
+            owned = Profile.cards.through.objects.filter(profile_id=profile.id).values('card_id')
+            entries = entries.filter(card_id__in=owned)
+        elif (duplicates is False and isinstance(entry_list, list) and entry_list
+              and all(isinstance(entry_id, int) for entry_id in entry_list)):
+            entries = entries.filter(id__in=entry_list)
+        else:
+            message = {'error': ERROR_TURN_TO_DUST_BULK_INCORRECT}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            with transaction.atomic():
+                n_entries, dust, profile.dust = turn_entries_into_dust(profile.id, entries)
+                if entry_list is not None and n_entries != len(set(entry_list)):
+                    raise CardEntry.DoesNotExist
+        except CardEntry.DoesNotExist:
+            message = {'error': ERROR_CARD_ENTRY_DOES_NOT_EXIST}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+        except EntriesChanged:
+            message = {'error': ERROR_CARD_ENTRIES_CHANGED}
+            return Response(message, status=status.HTTP_409_CONFLICT)
+
+        message = {'n_entries': n_entries,
+                   'dust': dust,
+                   'remaining_dust': profile.dust,
+                   'message': MESSAGE_TURN_TO_DUST_SUCCESS}
+        return Response(message)
+
+
 class CardsBulkView(generics.GenericAPIView):
-    """View for multiple Card set. Returns the list with cards specified."""
+    """
+    View for multiple Card set. Returns the list with cards specified.
+    Cards are fetched with one IN query per chunk of IDs before response is
+    built, so no query runs while response is sent. With 'rarity' ordering
+    cards are ordered by rarity in SQL (epic, rare, common, other) and by ID
+    within rarity. IDs of cards that do not exist are returned in 'missing'.
+    Cards are lightweight like in lists, fields may be selected with
+    ?fields= and ?omit=.
+    """
     permission_classes = [permissions.IsAuthenticated]
+    chunk_size = 500
+    rarity_ordering = Case(When(rarity='epic', then=0),
+                           When(rarity='rare', then=1),
+                           When(rarity='common', then=2),
+                           default=3, output_field=IntegerField())
 
     def post(self, request, *args, **kwargs):
-        data = []
-        cards = []
-        user = request.user
         card_list = request.data.get('cards', [])
         ordering = request.data.get('ordering', None)
 
-        user_profile_cards = list(user.profile.cards.values_list('id', flat=True))
-        
-        if card_list:
-            for card_id in card_list:
-                try:
-                    card = Card.objects.get(id=card_id)
-                except CardEntry.DoesNotExist:
-                    message = {'error': ERROR_CARD_DOES_NOT_EXIST}
-                    return Response(message, status=status.HTTP_400_BAD_REQUEST)
-                cards.append(card)
+        # Card IDs may be sent as numbers or numeric strings
+        try:
+            if not isinstance(card_list, list):
+                raise TypeError
+            card_list = [int(card_id) for card_id in card_list]
+        except (TypeError, ValueError):
+            message = {'error': ERROR_CARDS_BULK_INCORRECT}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        # Number of times each Card ID requested, in request order
+        card_counts = Counter(card_list)
+        card_ids = list(card_counts)
 
         if ordering == 'rarity':
-            epic_list = [card for card in cards if card.rarity == 'epic']
-            rare_list = [card for card in cards if card.rarity == 'rare']
-            common_list = [card for card in cards if card.rarity == 'common']
-            cards = epic_list + rare_list + common_list
-        
-        for card in cards:
-            addable = 'false' if card.id in user_profile_cards else 'true'
-            data.append({'card': CardSerializer(card, context=self.get_serializer_context()).data,
-                         'addable': addable})
-
-        message = {'results': data}
+            cards = list(self.iter_cards_by_rarity(self.get_chunks(card_ids), card_counts))
+        else:
+            cards = list(self.iter_cards(self.get_chunks(card_list)))
+
+        profile = request.user.profile
+        serializer = CardSerializer(context=self.get_serializer_context())
+        found = {card.id for card in cards}
+        message = {'results': [{'card': serializer.to_representation(card),
+                                'addable': 'false' if owns_card(profile, card.id) else 'true'}
+                               for card in cards],
+                   'missing': [card_id for card_id in card_ids if card_id not in found]}
         return Response(message)
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['lightweight'] = True
+        return context
+
+    def get_card_queryset(self):
+        """Returns Card queryset deferring columns not serialized"""
+        serializer = CardSerializer(context=self.get_serializer_context())
+        return Card.objects.defer(*serializer.get_deferred_model_fields())
+
+    def get_chunks(self, card_ids):
+        """Splits list of Card IDs into chunks of chunk_size"""
+        return [card_ids[i:i + self.chunk_size] for i in range(0, len(card_ids), self.chunk_size)]
+
+    def iter_cards(self, chunks):
+        """Yields cards in request order, one query per chunk"""
+        for chunk in chunks:
+            cards = self.get_card_queryset().in_bulk(set(chunk))
+            for card_id in chunk:
+                if card_id in cards:
+                    yield cards[card_id]
+
+    def iter_cards_by_rarity(self, chunks, card_counts):
+        """Yields cards ordered by rarity in SQL, merging ordered chunks"""
+        chunk_cards = [self.get_card_queryset()
+                       .filter(id__in=chunk)
+                       .annotate(rarity_order=self.rarity_ordering)
+                       .order_by('rarity_order', 'id')
+                       for chunk in chunks]
+        for card in heapq.merge(*chunk_cards, key=lambda card: (card.rarity_order, card.id)):
+            for _ in range(card_counts[card.id]):
+                yield card
+
 
 class CollectionProgressView(generics.GenericAPIView):
     """View for collection progress"""
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        collection = Collection.objects.get(id=self.kwargs['collection_id'])
-        collection_cards = collection.cards.all()
-        collection_card_ids = [card.id for card in collection_cards]
-
-        user = request.user
-        user_cards = user.profile.cards.all()
-        user_card_ids = [card.id for card in user_cards]
-
-        acquired = [id for id in collection_card_ids if id in user_card_ids]
-        not_acquired = [id for id in collection_card_ids if id not in user_card_ids]
-
-        message = {'acquired': acquired,
-                   'not_acquired': not_acquired}
+        message = get_collection_progress(request.user.profile, self.kwargs['collection_id'])
         return Response(message)
 
 
 class GetUserStatisticsView(generics.GenericAPIView):
-    """View for User statistics across collected Cards and Collections"""
+    """
+    View for User statistics across collected Cards and Collections.
+    User numbers are Profile counters, Card and Collection numbers are cached.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        user = request.user
-        n_user_cards = user.profile.cards.count()
-        n_user_collections = user.profile.collections.count()
-        n_cards = Card.objects.count()
-        n_collections = Collection.objects.count()
-
-        message = {'n_user_cards': n_user_cards,
-                   'n_user_collections': n_user_collections,
-                   'n_cards': n_cards,
-                   'n_collections': n_collections}
+        message = get_user_statistics(request.user.profile)
         return Response(message)
 
 
@@ -408,11 +729,7 @@ class IsAddableToCollectionView(generics.GenericAPIView):
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
 
         user = card_entry.user
-        card = card_entry.card
-        cards_list = list(user.profile.cards.all().values())
-        cards_list = [c['id'] for c in cards_list]
-
-        if card.id in cards_list:
+        if owns_card(user.profile, card_entry.card_id):
             message = {'result': 'false'}
         else:
             message = {'result': 'true'}
@@ -424,17 +741,7 @@ class IsDailyCardAvailableView(generics.GenericAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
-        last_daily = CardEntry.objects.filter(user=request.user).filter(source='daily').last()
-        if last_daily is None:
-            last_date = datetime.date(year=2000, month=1, day=1)
-        else:
-            last_date = last_daily.acquired
-
-        today = datetime.datetime.now(pytz.utc)
-        if today.date() == last_date:
-            message = {'result': 'false'}
-        else:
-            message = {'result': 'true'}
+        message = {'result': is_daily_card_available(request.user)}
         return Response(message)
 
 
@@ -448,11 +755,94 @@ class IsCraftableView(generics.GenericAPIView):
         card = Card.objects.get(id=card_id)
         profile = request.user.profile
 
-        if card in profile.cards.all():
-            message = {'result': 'already_in_collection'}
-        elif profile.dust < card.craft_cost:
-            message = {'result': 'not_enough_dust'}
-        else:
-            message = {'result': 'true'}
+        message = {'result': get_craftable_result(profile, card.id, card.craft_cost)}
+        return Response(message)
+
 
+class EligibilityBulkView(generics.GenericAPIView):
+    """
+    View for craftable and addable checks of many cards at once.
+    Takes Card IDs in 'cards' and CardEntry IDs in 'entries', results are
+    the same as of is_craftable and is_addable. Cards and entries are
+    fetched with one query each. IDs that do not exist are returned in
+    'missing_cards' and 'missing_entries'.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        card_list = request.data.get('cards', [])
+        entry_list = request.data.get('entries', [])
+        for id_list in (card_list, entry_list):
+            if not isinstance(id_list, list) or not all(isinstance(item_id, int) for item_id in id_list):
+                message = {'error': ERROR_ELIGIBILITY_BULK_INCORRECT}
+                return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        profile = request.user.profile
+        craftable = {}
+        if card_list:
+            craft_costs = dict(Card.objects.filter(id__in=card_list).values_list('id', 'craft_cost'))
+            for card_id, craft_cost in craft_costs.items():
+                craftable[card_id] = get_craftable_result(profile, card_id, craft_cost)
+
+        # Entry is addable if its owner does not own the card yet
+        addable = {}
+        if entry_list:
+            entries = (CardEntry.objects
+                       .filter(id__in=entry_list)
+                       .values_list('id', 'card_id', 'user__profile__owned_cards'))
+            for entry_id, card_id, owned_cards in entries:
+                owner = Profile(owned_cards=owned_cards or b'')
+                addable[entry_id] = 'false' if owns_card(owner, card_id) else 'true'
+
+        message = {'craftable': craftable,
+                   'addable': addable,
+                   'missing_cards': [card_id for card_id in dict.fromkeys(card_list) if card_id not in craftable],
+                   'missing_entries': [entry_id for entry_id in dict.fromkeys(entry_list) if entry_id not in addable]}
         return Response(message)
+
+
+class ResizeImageView(generics.GenericAPIView):
+    """
+    View for resized image from MEDIA_ROOT, e.g. ?w=240&fmt=webp.
+    Width and format are checked against IMAGE_RESIZE_WIDTHS and
+    RESIZE_FORMATS, rendered images are served from LRU disk cache.
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.GET.get('fmt', 'jpg')
+        try:
+            width = int(request.GET.get('w', ''))
+        except ValueError:
+            width = None
+        if width not in settings.IMAGE_RESIZE_WIDTHS or fmt not in RESIZE_FORMATS:
+            message = {'error': ERROR_IMAGE_SIZE_INCORRECT}
+            return Response(message, status=status.HTTP_400_BAD_REQUEST)
+
+        name = self.kwargs['name']
+        try:
+            source = safe_join(settings.MEDIA_ROOT, name)
+        except SuspiciousFileOperation:
+            source = None
+        if source is None or not os.path.isfile(source):
+            message = {'error': ERROR_IMAGE_DOES_NOT_EXIST}
+            return Response(message, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            image_file, key = get_resize_cache().open(source, name, width, fmt)
+        except (UnidentifiedImageError, FileNotFoundError):
+            message = {'error': ERROR_IMAGE_DOES_NOT_EXIST}
+            return Response(message, status=status.HTTP_404_NOT_FOUND)
+
+        etag = f'"{key}"'
+        cache_control = f'public, max-age={settings.IMAGE_RESIZE_MAX_AGE}'
+        if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            image_file.close()
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(image_file, content_type=RESIZE_FORMATS[fmt][1])
+            response['Content-Length'] = os.fstat(image_file.fileno()).st_size
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
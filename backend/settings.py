@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
 import os
+import sys
 from datetime import timedelta
 from pathlib import Path
 from config import *
@@ -50,6 +51,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.RequestMetricsMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # DRF
@@ -103,6 +106,29 @@ DATABASES = {
     }
 }
 
+# Tests and benchmarks (api/tests.py) run on SQLite, without database server.
+# Only 'manage.py test' switches, not other commands with 'test' argument.
+if sys.argv[1:2] == ['test']:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'test.sqlite3'),
+        }
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Card pool and catalog versions are kept in the cache, use a shared backend
+# (e.g. Redis or Memcached) when running several processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'collections',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -143,6 +169,53 @@ MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 CKEDITOR_UPLOAD_PATH = "uploads/"
 
+# Uploaded files are saved under content hash names, their URLs are immutable
+DEFAULT_FILE_STORAGE = 'api.media.ContentHashStorage'
+
+# Media delivery: 'django' serves files from Python (development),
+# 'x-accel' hands them to nginx internal location MEDIA_ACCEL_REDIRECT_PREFIX,
+# 'x-sendfile' to Apache mod_xsendfile or lighttpd
+MEDIA_SERVE_MODE = 'django'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# Cache lifetime of media files which names are not content hashes
+MEDIA_MAX_AGE = 60 * 60
+
+# Thumbnails, WebP and grayscaled versions of Card and Collection images
+# are rendered in a process pool after save
+IMAGE_DERIVATIVES_ASYNC = True
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# On-demand resized images: allowed widths and LRU disk cache
+IMAGE_RESIZE_WIDTHS = [120, 180, 240, 320, 480, 640, 960]
+IMAGE_RESIZE_CACHE_DIR = os.path.join(BASE_DIR, 'image_cache')
+IMAGE_RESIZE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+IMAGE_RESIZE_MAX_AGE = 60 * 60 * 24 * 30
+
+# Request metrics: Server-Timing header and Prometheus metrics at /metrics/
+# for requests with 'Authorization: Bearer <METRICS_TOKEN>' header from
+# METRICS_ALLOWED_IPS (None allows every address, behind a proxy every client
+# has the proxy address). /metrics/ is off while METRICS_TOKEN is None.
+# Metrics are kept per worker process, /metrics/ shows only the process
+# answering the request.
+REQUEST_METRICS_SERVER_TIMING = True
+METRICS_TOKEN = None
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Profiling of sampled requests (PROFILING_SAMPLE_RATE from 0 to 1) and of
+# requests with 'X-Profile: <PROFILING_HEADER_TOKEN>' header. Mode 'cprofile'
+# writes pstats files, 'sampling' writes collapsed stacks for flamegraphs.
+# Off by default, then middleware is removed on startup.
+PROFILING_SAMPLE_RATE = 0
+PROFILING_HEADER_TOKEN = None
+PROFILING_MODE = 'cprofile'
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MAX_FILES = 200
+PROFILING_SAMPLE_INTERVAL = 0.005
+
+# Serve hot read-only API endpoints with async views (see api.async_urls),
+# useful when running under ASGI server
+API_ASYNC_READS = False
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -163,7 +236,7 @@ CORS_ORIGIN_WHITELIST = ["http://localhost:8080", "http://127.0.0.1:8080"]
 # Django REST Framework configuration
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": ["rest_framework_simplejwt.authentication.JWTAuthentication"],
-    "DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"],
+    "DEFAULT_RENDERER_CLASSES": ["api.metrics.MetricsJSONRenderer"],
     "TEST_REQUEST_DEFAULT_FORMAT": "json",
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.DjangoModelPermissions",),
 }